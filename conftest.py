@@ -0,0 +1,9 @@
+import pytest
+
+from yatube.testing import isolated_storage
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _isolated_storage():
+    with isolated_storage():
+        yield
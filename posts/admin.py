@@ -1,6 +1,10 @@
 from django.contrib import admin
+from django.contrib.admin.views.main import SEARCH_VAR
+from django.db import connection
+from django.utils.html import format_html
 
-from .models import Post, Group
+from .models import Post, Group, RequestProfile, SlowQuery
+from .search import search_posts
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +13,18 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Без ограничения SEARCH_MAX_RESULTS: в админке ищут и старые посты.
+        if not search_term:
+            return queryset, False
+        return search_posts(search_term, queryset, capped=False), False
+
+    def get_ordering(self, request):
+        # Иначе ChangeList заменит порядок по релевантности своим.
+        if request.GET.get(SEARCH_VAR) and connection.vendor == "sqlite":
+            return ("rank", "-pub_date")
+        return super().get_ordering(request)
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ("title", "slug", "description")
@@ -16,5 +32,39 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
+class ReadOnlyAdmin(admin.ModelAdmin):
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+class RequestProfileAdmin(ReadOnlyAdmin):
+    list_display = ("created", "path", "view_name", "user", "duration")
+    list_filter = ("view_name",)
+    fields = ("created", "path", "view_name", "user", "duration",
+              "stats_text")
+    readonly_fields = fields
+
+    def stats_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.stats)
+    stats_text.short_description = "статистика"
+
+
+class SlowQueryAdmin(ReadOnlyAdmin):
+    list_display = ("created", "view_name", "duration", "database", "sql")
+    list_filter = ("view_name", "database")
+    fields = ("created", "path", "view_name", "database", "duration",
+              "sql", "plan_text")
+    readonly_fields = fields
+
+    def plan_text(self, obj):
+        return format_html("<pre>{}</pre>", obj.plan)
+    plan_text.short_description = "план запроса"
+
+
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
+admin.site.register(RequestProfile, RequestProfileAdmin)
+admin.site.register(SlowQuery, SlowQueryAdmin)
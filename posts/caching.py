@@ -0,0 +1,147 @@
+import hashlib
+import math
+import random
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+from yatube import metrics
+from yatube.db import use_primary
+
+GENERATION_KEY = "posts:generation"
+# Меняется при подписке и отписке: от подписок зависят лента подписок и
+# счётчики в карточке автора.
+FOLLOWS_GENERATION_KEY = "posts:follows"
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+# Отдал ли текущий запрос устаревшую копию, см. served_stale().
+_served = threading.local()
+
+
+def _initial_generation():
+    # Случайное начало: после очистки кеша номера не повторяют прежние,
+    # и старые ETag не совпадут с новыми страницами.
+    return random.randrange(1 << 48)
+
+
+def generation(key=GENERATION_KEY):
+    """Номер поколения данных ленты: меняется при любом изменении постов,
+    комментариев и групп. Запись кеша другого поколения считается
+    устаревшей. key — другой счётчик, например FOLLOWS_GENERATION_KEY."""
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, _initial_generation(), timeout=None)
+        value = cache.get(key, 1)
+    return value
+
+
+def bump_generation(key=GENERATION_KEY):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, _initial_generation(), timeout=None)
+
+
+def viewer_key(request):
+    # Страница авторизованного пользователя содержит его имя и ссылки на
+    # редактирование своих постов, поэтому делить её между людьми нельзя.
+    if request.user.is_authenticated:
+        return f"user{request.user.pk}"
+    return "anon"
+
+
+def feed_cache_key(request, prefix):
+    return ":".join((
+        "feed", prefix, viewer_key(request), request.get_full_path(),
+    ))
+
+
+def page_etag(request, *args, **kwargs):
+    """ETag страницы без её построения: зритель, полный путь и поколения
+    данных и подписок, полученные одним обращением к кешу."""
+    keys = (GENERATION_KEY, FOLLOWS_GENERATION_KEY)
+    values = cache.get_many(keys)
+    generations = [values.get(key) or generation(key) for key in keys]
+    parts = [viewer_key(request), request.get_full_path(), *generations]
+    if request.user.is_authenticated:
+        # В форме комментария токен CSRF, а вход в систему меняет его
+        # секрет: страница с прежним токеном не должна получить 304.
+        parts.append(request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def reset_stale():
+    _served.stale = False
+
+
+def served_stale():
+    """Вернул ли get_or_rebuild в этом потоке устаревшую копию после
+    последнего reset_stale()."""
+    return getattr(_served, "stale", False)
+
+
+def cache_stats():
+    """Счётчики hit/miss/stale этого процесса."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+    metrics.count_cache(outcome)
+
+
+def _is_fresh(entry, version, now):
+    if entry is None or entry["version"] != version:
+        return False
+    # Вероятностное раннее обновление (XFetch): чем дороже пересчёт и чем
+    # ближе срок, тем вероятнее, что запись обновит один из запросов
+    # заранее, а не все сразу после истечения.
+    early = -entry["delta"] * settings.FEED_CACHE_EARLY_REFRESH * math.log(
+        1.0 - random.random())
+    return now + early < entry["expires"]
+
+
+def get_or_rebuild(key, rebuild, timeout, version=None):
+    """Возвращает значение из кеша, пересчитывая его не более чем в одном
+    запросе одновременно.
+
+    Пока один запрос держит короткую блокировку и пересчитывает запись,
+    остальные получают устаревшую копию (другое version или истёкший
+    срок). Без копии пересчитывают все. rebuild() может вернуть None,
+    тогда результат не кешируется.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if _is_fresh(entry, version, now):
+        _count("hit")
+        return entry["value"]
+    lock_key = f"{key}:lock"
+    locked = cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT)
+    if not locked and entry is not None:
+        _count("stale")
+        _served.stale = True
+        return entry["value"]
+    _count("miss")
+    try:
+        # Пересчёт читает основную базу: копия из отстающей реплики
+        # осталась бы в кеше до следующей смены поколения.
+        with use_primary():
+            value = rebuild()
+        delta = time.time() - now
+        if value is not None:
+            cache.set(key, {
+                "value": value,
+                "version": version,
+                "delta": delta,
+                "expires": now + delta + timeout,
+            }, timeout + settings.FEED_CACHE_STALE_TIMEOUT)
+    finally:
+        if locked:
+            cache.delete(lock_key)
+    return value
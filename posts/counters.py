@@ -0,0 +1,66 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+STATS_SOURCES = {
+    "posts_count": (Post, "author"),
+    "followers_count": (Follow, "author"),
+    "following_count": (Follow, "user"),
+}
+
+
+def _count_subquery(model, field, outer="pk"):
+    counts = (
+        model.objects.filter(**{field: OuterRef(outer)})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def bump_comments(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comment_count=F("comment_count") + delta)
+
+
+def bump_stats(user_id, field, delta):
+    updated = UserStats.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta})
+    if not updated and delta > 0:
+        recount_user(user_id)
+
+
+def recount_user(user_id):
+    UserStats.objects.update_or_create(
+        user_id=user_id,
+        defaults={
+            field: model.objects.filter(**{source: user_id}).count()
+            for field, (model, source) in STATS_SOURCES.items()
+        },
+    )
+
+
+def reconcile():
+    """Пересчитывает счётчики, разошедшиеся с данными.
+
+    Возвращает число исправленных строк по каждому счётчику.
+    """
+    fixed = {}
+    actual = _count_subquery(Comment, "post")
+    drifted = Post.objects.annotate(actual=actual).exclude(
+        comment_count=F("actual"))
+    fixed["comment_count"] = drifted.update(comment_count=actual)
+
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        "pk", flat=True)
+    UserStats.objects.bulk_create(
+        [UserStats(user_id=pk) for pk in missing], batch_size=500)
+    for field, (model, source) in STATS_SOURCES.items():
+        actual = _count_subquery(model, source, outer="user")
+        drifted = UserStats.objects.annotate(actual=actual).exclude(
+            **{field: F("actual")})
+        fixed[field] = drifted.update(**{field: actual})
+    return fixed
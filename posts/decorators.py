@@ -0,0 +1,77 @@
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+
+from yatube.db import read_from_replica
+
+from .caching import (feed_cache_key, generation, get_or_rebuild, page_etag,
+                      reset_stale, served_stale)
+
+
+def query_budget(queries):
+    """Объявляет, сколько SQL-запросов может сделать представление при
+    любом размере страницы, включая загрузку сессии и пользователя.
+
+    Бюджет проверяется в тестах, см. QueryBudgetMixin в posts/tests.py.
+    """
+    def decorator(view):
+        view.query_budget = queries
+        return view
+    return decorator
+
+
+def cache_feed(timeout=None):
+    """Кеширует страницу ленты для каждого зрителя и полного пути запроса
+    (номер страницы, курсор) до смены поколения данных.
+
+    После изменения данных страницу пересчитывает один запрос, остальные
+    пока получают предыдущую версию, см. caching.get_or_rebuild.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            response = None
+
+            def rebuild():
+                nonlocal response
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return None
+                if hasattr(response, "render"):
+                    response.render()
+                return response.content, response["Content-Type"]
+
+            cached = get_or_rebuild(
+                feed_cache_key(request, view.__name__), rebuild,
+                timeout or settings.FEED_CACHE_TIMEOUT, version=generation())
+            if response is not None:
+                return response
+            content, content_type = cached
+            return HttpResponse(content, content_type=content_type)
+        return wrapper
+    return decorator
+
+
+def conditional_page(view):
+    """Отвечает 304, если ETag из caching.page_etag совпал с If-None-Match,
+    не вызывая представление.
+
+    ETag считается по текущему поколению. Если страница собрана из
+    устаревшей копии кеша (пересчёт держит другой запрос) или прочитана
+    из реплики, которая может отставать, ETag не ставится, иначе клиент
+    закрепил бы старую страницу под новым ETag.
+    """
+    conditional = condition(etag_func=page_etag)(view)
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        reset_stale()
+        response = conditional(request, *args, **kwargs)
+        if served_stale() or read_from_replica():
+            del response["ETag"]
+        return response
+    return wrapper
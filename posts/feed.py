@@ -0,0 +1,190 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q
+
+from .models import LIST_DEFERRED, FeedEntry, Follow, Post, User, UserStats
+from .paginator import keyset_filter
+
+
+def _pulled():
+    return (Q(followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+            | Q(feed_pulled=True))
+
+
+def is_pulled(author):
+    """Посты авторов с огромным числом подписчиков не раскладываются
+    по лентам, а подмешиваются при чтении."""
+    return UserStats.objects.filter(_pulled(), user=author).exists()
+
+
+def pulled_authors(user):
+    return User.objects.filter(
+        Q(stats__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS)
+        | Q(stats__feed_pulled=True),
+        following__user=user,
+    ).values_list("pk", flat=True)
+
+
+def mark_pulled(author):
+    """Вызывается после подписки. Автор, перешедший порог, остаётся
+    подмешиваемым, пока его посты не разложит restore_fan_out."""
+    UserStats.objects.filter(
+        user=author, feed_pulled=False,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+    ).update(feed_pulled=True)
+
+
+def fan_out(post):
+    if is_pulled(post.author_id):
+        return
+    followers = Follow.objects.filter(author=post.author_id).values_list(
+        "user", flat=True)
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, post=post, author_id=post.author_id,
+                      pub_date=post.pub_date)
+            for user_id in followers
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def backfill(user, author):
+    if is_pulled(author):
+        return
+    posts = Post.objects.filter(author=author).values_list("id", "pub_date")
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user=user, post_id=post_id, author=author,
+                      pub_date=pub_date)
+            for post_id, pub_date in posts[:settings.FEED_BACKFILL_SIZE]
+        ],
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+def pending_restores():
+    """Подмешиваемые авторы, у которых подписчиков стало не больше
+    FEED_FANOUT_RESTORE_FOLLOWERS. Порог ниже FEED_FANOUT_MAX_FOLLOWERS,
+    чтобы автор на границе не раскладывался заново после каждой
+    отписки."""
+    return UserStats.objects.filter(
+        feed_pulled=True,
+        followers_count__lte=settings.FEED_FANOUT_RESTORE_FOLLOWERS,
+    ).values_list("user", flat=True)
+
+
+def _fan_out_posts(author, followers, posts):
+    batch = []
+    for user_id in followers.iterator():
+        batch += [FeedEntry(user_id=user_id, post_id=post_id,
+                            author_id=author, pub_date=pub_date)
+                  for post_id, pub_date in posts]
+        if len(batch) >= 5000:
+            FeedEntry.objects.bulk_create(
+                batch, batch_size=500, ignore_conflicts=True)
+            batch = []
+    FeedEntry.objects.bulk_create(
+        batch, batch_size=500, ignore_conflicts=True)
+
+
+def restore_fan_out(author):
+    """Раскладывает последние FEED_BACKFILL_SIZE постов автора всем
+    подписчикам: пока его подмешивали при чтении, записи для новых
+    постов и подписок не создавались.
+
+    Пока флаг feed_pulled стоит, ленты читают автора подмешиванием и
+    не видят частично разложенных записей. Флаг снимается в конце вместе
+    с раскладкой постов и подписок, появившихся за это время, и
+    удалением записей у тех, кто за это время отписался.
+    """
+    posts = list(Post.objects.filter(author=author).values_list(
+        "id", "pub_date")[:settings.FEED_BACKFILL_SIZE])
+    follows = Follow.objects.filter(author=author)
+    last_follow = follows.aggregate(last=Max("id"))["last"] or 0
+    _fan_out_posts(author, follows.values_list("user", flat=True), posts)
+    last_post = max((post_id for post_id, _ in posts), default=0)
+    with transaction.atomic():
+        # Сначала запись: новые посты и подписки ждут конца транзакции.
+        UserStats.objects.filter(user=author).update(feed_pulled=False)
+        newer = list(Post.objects.filter(
+            author=author, id__gt=last_post).values_list("id", "pub_date"))
+        _fan_out_posts(author, follows.values_list("user", flat=True), newer)
+        posts = list(Post.objects.filter(author=author).values_list(
+            "id", "pub_date")[:settings.FEED_BACKFILL_SIZE])
+        _fan_out_posts(author, follows.filter(id__gt=last_follow)
+                       .values_list("user", flat=True), posts)
+        FeedEntry.objects.filter(author=author).exclude(
+            user__in=follows.values("user")).delete()
+
+
+def prune(user, author):
+    FeedEntry.objects.filter(user=user, author=author).delete()
+
+
+class FollowFeed:
+    """Лента подписок: материализованные записи пользователя плюс посты
+    «тяжёлых» авторов, которые сливаются по (pub_date, id) при чтении.
+
+    Поддерживает count() и срезы, поэтому её можно отдать Paginator,
+    и keyset() для CursorPaginator.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.pulled = list(pulled_authors(user))
+
+    def _sources(self):
+        entries = FeedEntry.objects.filter(user=self.user)
+        if not self.pulled:
+            return [entries.values_list("pub_date", "post")]
+        pulled_posts = (
+            Post.objects.filter(author__in=self.pulled)
+            .order_by("-pub_date", "-id")
+        )
+        return [
+            entries.exclude(author__in=self.pulled)
+            .values_list("pub_date", "post"),
+            pulled_posts.values_list("pub_date", "id"),
+        ]
+
+    def count(self):
+        return sum(source.count() for source in self._sources())
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        sources = self._sources()
+        if len(sources) == 1:
+            keys = sources[0][start:stop]
+        else:
+            merged = heapq.merge(
+                *(source[:stop] for source in sources), reverse=True)
+            keys = islice(merged, start, stop)
+        return self._posts([post_id for _, post_id in keys])
+
+    def keyset(self, key, forward, limit):
+        entries = FeedEntry.objects.filter(user=self.user)
+        sources = []
+        if self.pulled:
+            entries = entries.exclude(author__in=self.pulled)
+            pulled_posts = Post.objects.filter(author__in=self.pulled)
+            sources.append(
+                keyset_filter(pulled_posts, key, forward)
+                .values_list("pub_date", "id")[:limit])
+        sources.append(
+            keyset_filter(entries, key, forward, fields=("pub_date", "post_id"))
+            .values_list("pub_date", "post")[:limit])
+        merged = heapq.merge(*sources, reverse=forward)
+        return self._posts([post_id for _, post_id in islice(merged, limit)])
+
+    def _posts(self, ids):
+        posts = Post.objects.select_related("author", "group").defer(
+            *LIST_DEFERRED).in_bulk(ids)
+        return [posts[post_id] for post_id in ids if post_id in posts]
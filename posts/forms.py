@@ -1,5 +1,7 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
+from .images import ingest
 from .models import Post, Comment
 
 
@@ -8,6 +10,18 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('group', 'text', 'image')
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        if not image:
+            self.instance.image_width = self.instance.image_height = None
+            self.instance.image_format = ''
+        elif isinstance(image, UploadedFile):
+            image, width, height, image_format = ingest(image)
+            self.instance.image_width = width
+            self.instance.image_height = height
+            self.instance.image_format = image_format
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
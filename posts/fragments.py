@@ -0,0 +1,54 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+# Место в карточке поста, куда вставляется ссылка на редактирование.
+EDIT_MARKER = "<!-- edit-link -->"
+
+
+def card_key(post, preview):
+    """Ключ карточки поста: число комментариев и отпечаток всего, что в
+    ней показано. Правка поста, новая миниатюра, переименование автора
+    или группы дают новый ключ, старая запись просто истекает."""
+    group = post.group
+    shown = [
+        post.pub_date.isoformat(), post.thumbnail, post.image.name,
+        post.image_width, post.image_height, post.author.username,
+        group and (group.slug, group.title),
+        (post.preview_html, post.text_truncated) if preview
+        else post.text_html,
+    ]
+    digest = hashlib.md5(repr(shown).encode()).hexdigest()
+    return f"card:{post.pk}:{int(preview)}:{post.comment_count}:{digest}"
+
+
+def render_cards(request, posts, preview=False):
+    """HTML карточек posts для этого запроса.
+
+    Общая для всех часть берётся из кеша одним get_many, недостающие
+    карточки рендерятся и сохраняются. Для каждого запроса рендерится
+    только ссылка на редактирование в постах самого пользователя.
+    """
+    posts = list(posts)
+    keys = [card_key(post, preview) for post in posts]
+    cards = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        if key not in cards:
+            missing[key] = render_to_string(
+                "posts/includes/post_item.html",
+                {"post": post, "preview": preview})
+    if missing:
+        cache.set_many(missing, settings.POST_CARD_CACHE_TIMEOUT)
+        cards.update(missing)
+    result = []
+    for key, post in zip(keys, posts):
+        edit_link = ""
+        if request.user.pk == post.author_id:
+            edit_link = render_to_string(
+                "posts/includes/post_edit_link.html", {"post": post})
+        result.append(mark_safe(cards[key].replace(EDIT_MARKER, edit_link)))
+    return result
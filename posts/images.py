@@ -0,0 +1,60 @@
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image, ImageOps
+
+FORMATS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+# Режимы, которые можно сохранить в формате без преобразования.
+MODES = {
+    "JPEG": ("RGB",),
+    "PNG": ("1", "L", "LA", "P", "RGB", "RGBA"),
+    "WEBP": ("RGB", "RGBA"),
+}
+
+
+def ingest(upload):
+    """Готовит загруженную картинку к сохранению.
+
+    Размеры берутся из заголовка до декодирования, слишком большие
+    картинки отклоняются, крупные уменьшаются (JPEG сразу декодируется в
+    уменьшенном масштабе), EXIF отбрасывается при перекодировании.
+    Результат пишется во временный файл, а не в память.
+
+    Возвращает (файл, ширина, высота, формат).
+    """
+    if upload.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError("Файл изображения слишком большой.")
+    upload.seek(0)
+    try:
+        with Image.open(upload) as image:
+            width, height = image.size
+            if width * height > settings.POST_IMAGE_MAX_PIXELS:
+                raise ValidationError(
+                    f"Изображение {width}×{height} слишком большое.")
+            image_format = image.format if image.format in FORMATS \
+                else "PNG"
+            max_side = settings.POST_IMAGE_MAX_SIDE
+            image.draft("RGB", (max_side, max_side))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+            if image.mode not in MODES[image_format]:
+                # Например, CMYK из TIFF: в PNG его не записать.
+                alpha = ("A" in image.mode
+                         or "transparency" in image.info)
+                image = image.convert(
+                    "RGBA" if alpha and "RGBA" in MODES[image_format]
+                    else "RGB")
+            output = tempfile.SpooledTemporaryFile(
+                max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+            image.save(output, image_format, optimize=True,
+                       **({"quality": 85} if image_format == "JPEG"
+                          else {}))
+            output.seek(0)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise ValidationError("Не удалось обработать изображение.")
+    name = os.path.splitext(os.path.basename(upload.name))[0]
+    return (File(output, name=name + FORMATS[image_format]),
+            image.width, image.height, image_format)
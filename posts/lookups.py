@@ -0,0 +1,115 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import Http404
+
+from .models import Group, User
+
+
+class LRUCache:
+    """Ограниченный потокобезопасный кеш: при переполнении вытесняет
+    давно не использованные записи, записи старше ttl секунд не отдаёт."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def discard(self, predicate):
+        """Удаляет записи, для ключа и значения которых predicate истинен."""
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items()
+                        if predicate(key, value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "size": len(self._data),
+                    "hit_rate": self.hits / total if total else 0.0}
+
+
+# Модель -> поле, по которому её ищут представления.
+LOOKUP_FIELDS = {User: "username", Group: "slug"}
+
+_caches = {
+    model: LRUCache(settings.LOOKUP_CACHE_SIZE, settings.LOOKUP_CACHE_TTL)
+    for model in LOOKUP_FIELDS
+}
+
+
+def _get_or_404(model, value):
+    # Кешируются значения полей, а не объект: каждый запрос получает свой
+    # экземпляр, и связанные объекты, загруженные одним запросом, не
+    # достаются другим.
+    cache = _caches[model]
+    names = [field.attname for field in model._meta.concrete_fields]
+    entry = cache.get(value)
+    if entry is not None:
+        db, values = entry
+        return model.from_db(db, names, values)
+    try:
+        obj = model._default_manager.get(**{LOOKUP_FIELDS[model]: value})
+    except model.DoesNotExist:
+        raise Http404(f"No {model._meta.object_name} matches the given query.")
+    cache.set(value, (obj._state.db, [getattr(obj, name) for name in names]))
+    return obj
+
+
+def get_user_or_404(username):
+    return _get_or_404(User, username)
+
+
+def get_group_or_404(slug):
+    return _get_or_404(Group, slug)
+
+
+def forget(model, instance):
+    """Убирает из кеша объект (в том числе под старым именем после
+    переименования) и всё, что записано под его текущим именем."""
+    key = getattr(instance, LOOKUP_FIELDS[model])
+    pk_index = [field.attname for field in model._meta.concrete_fields].index(
+        model._meta.pk.attname)
+    _caches[model].discard(
+        lambda cached, entry: cached == key
+        or entry[1][pk_index] == instance.pk)
+
+
+def clear():
+    for cache in _caches.values():
+        cache.clear()
+
+
+def lookup_stats():
+    """Попадания и промахи кешей поиска этого процесса по имени модели."""
+    return {model._meta.model_name: cache.stats()
+            for model, cache in _caches.items()}
@@ -0,0 +1,167 @@
+import datetime
+import random
+import statistics
+import time
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from posts import counters, feed
+from posts.models import Comment, Follow, Group, Post
+from posts.text import render_text
+
+User = get_user_model()
+
+LOCMEM_CACHE = "django.core.cache.backends.locmem.LocMemCache"
+DUMMY_CACHE = "django.core.cache.backends.dummy.DummyCache"
+WORDS = (
+    "кот", "собака", "город", "река", "утро", "вечер", "книга", "музыка",
+    "дорога", "море", "лес", "дом", "друг", "работа", "погода", "зима",
+    "лето", "поезд", "кофе", "фильм", "игра", "сад", "небо", "письмо",
+)
+
+
+@contextmanager
+def benchmark_database(cache_backend=LOCMEM_CACHE, name=None):
+    """Временная тестовая база и отдельный кеш, чтобы замеры не трогали
+    рабочие данные.
+
+    По умолчанию база SQLite в памяти; name — путь к файлу, если замеру
+    нужны настоящие блокировки и журнал.
+    """
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings["NAME"]
+    test_settings["NAME"] = name
+    old_name = connection.creation.create_test_db(
+        verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with override_settings(CACHES={"default": {
+                "BACKEND": cache_backend}}):
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def percentiles(timings):
+    """p50, p95 и p99 выборки (нужно хотя бы два значения)."""
+    cuts = statistics.quantiles(timings, n=100, method="inclusive")
+    return {"p50": cuts[49], "p95": cuts[94], "p99": cuts[98]}
+
+
+@contextmanager
+def manual_dates(model, field_name):
+    """Позволяет bulk_create записать свою дату в поле с auto_now_add."""
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def _zipf_weights(count, exponent):
+    return [1 / rank ** exponent for rank in range(1, count + 1)]
+
+
+def _text(rng, words):
+    return " ".join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def _post(author, group, text, pub_date):
+    # bulk_create не вызывает pre_save, поэтому HTML готовим сами.
+    text_html, preview_html, truncated = render_text(text)
+    return Post(author_id=author, group_id=group, text=text,
+                pub_date=pub_date, text_html=text_html,
+                preview_html=preview_html, text_truncated=truncated)
+
+
+def seed_dataset(users=100, groups=10, posts=10000, comments=20000,
+                 follows=20, zipf=1.1, days=365, seed=0, batch_size=5000):
+    """Заполняет базу синтетическими данными.
+
+    Авторы постов, посты под комментариями и авторы, на которых
+    подписываются, выбираются по закону Ципфа: немного очень активных и
+    популярных, длинный хвост редких. Счётчики и ленты подписок
+    пересчитываются в конце, потому что bulk_create не вызывает сигналы.
+    Всё выполняется в одной транзакции: так SQLite не синхронизирует
+    файл после каждой вставки.
+    """
+    with transaction.atomic():
+        return _seed(users, groups, posts, comments, follows, zipf, days,
+                     random.Random(seed), batch_size)
+
+
+def _seed(users, groups, posts, comments, follows, zipf, days, rng,
+          batch_size):
+    now = timezone.now()
+
+    def random_date():
+        return now - datetime.timedelta(seconds=rng.randint(0, days * 86400))
+
+    first_user = User.objects.count()
+    User.objects.bulk_create(
+        [User(username=f"user{first_user + i}") for i in range(users)])
+    user_ids = list(User.objects.values_list("pk", flat=True))
+    rng.shuffle(user_ids)
+    user_weights = _zipf_weights(len(user_ids), zipf)
+
+    first_group = Group.objects.count()
+    Group.objects.bulk_create(
+        [Group(title=f"Группа {first_group + i}",
+               slug=f"group-{first_group + i}",
+               description=_text(rng, 10)) for i in range(groups)])
+    group_ids = list(Group.objects.values_list("pk", flat=True)) + [None]
+
+    with manual_dates(Post, "pub_date"):
+        for start in range(0, posts, batch_size):
+            count = min(batch_size, posts - start)
+            authors = rng.choices(user_ids, user_weights, k=count)
+            Post.objects.bulk_create([
+                _post(author, rng.choice(group_ids),
+                      _text(rng, rng.randint(5, 60)), random_date())
+                for author in authors
+            ])
+
+    post_ids = list(Post.objects.values_list("pk", flat=True))
+    if post_ids:
+        rng.shuffle(post_ids)
+        post_weights = _zipf_weights(len(post_ids), zipf)
+        with manual_dates(Comment, "created"):
+            for start in range(0, comments, batch_size):
+                count = min(batch_size, comments - start)
+                targets = rng.choices(post_ids, post_weights, k=count)
+                readers = rng.choices(user_ids, k=count)
+                Comment.objects.bulk_create([
+                    Comment(post_id=post, author_id=author,
+                            text=_text(rng, rng.randint(3, 20)),
+                            created=random_date())
+                    for post, author in zip(targets, readers)
+                ])
+
+    edges = set()
+    for user in user_ids:
+        for author in rng.choices(user_ids, user_weights, k=follows):
+            if author != user:
+                edges.add((user, author))
+    Follow.objects.bulk_create(
+        [Follow(user_id=user, author_id=author) for user, author in edges],
+        ignore_conflicts=True)
+
+    counters.reconcile()
+    for follow in Follow.objects.select_related("user", "author"):
+        feed.backfill(follow.user, follow.author)
+    return {"users": users, "groups": groups, "posts": posts,
+            "comments": comments, "follows": len(edges)}
@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+from multiprocessing import Pool
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from yatube.cache import SQLiteCache
+
+PAYLOAD = "x" * 2048
+
+
+def _backends(directory):
+    return {
+        "locmem": lambda: LocMemCache("bench", {}),
+        "filebased": lambda: FileBasedCache(
+            os.path.join(directory, "files"), {}),
+        "sqlite": lambda: SQLiteCache(
+            os.path.join(directory, "cache.sqlite3"), {}),
+    }
+
+
+def _workload(args):
+    directory, name, operations = args
+    cache = _backends(directory)[name]()
+    keys = [f"key{i}" for i in range(200)]
+    start = time.perf_counter()
+    for i in range(operations):
+        key = keys[i % len(keys)]
+        if i % 10 == 0:
+            cache.set(key, PAYLOAD)
+        elif i % 10 == 1:
+            cache.get_many(keys[:10])
+        elif i % 10 == 2:
+            cache.add(f"{key}:lock", 1, 1)
+            if not cache.add("counter", 0):
+                cache.incr("counter")
+        else:
+            cache.get(key)
+    return operations / (time.perf_counter() - start)
+
+
+class Command(BaseCommand):
+    help = ("Пропускная способность LocMemCache, FileBasedCache и "
+            "SQLiteCache на смеси чтений и записей.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--operations", type=int, default=20000)
+        parser.add_argument("--processes", type=int, default=4)
+
+    def handle(self, *args, **options):
+        operations = options["operations"]
+        processes = options["processes"]
+        for name in ("locmem", "filebased", "sqlite"):
+            with tempfile.TemporaryDirectory() as directory:
+                single = _workload((directory, name, operations))
+                with Pool(processes) as pool:
+                    parallel = sum(pool.map(
+                        _workload,
+                        [(directory, name, operations)] * processes))
+            self.stdout.write(
+                f"{name:>9}: {single:10.0f} оп/с в одном процессе, "
+                f"{parallel:10.0f} оп/с в {processes} процессах")
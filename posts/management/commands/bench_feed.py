@@ -0,0 +1,65 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.paginator import Paginator
+
+from posts.feed import FollowFeed
+from posts.models import FeedEntry, Follow, Post
+
+from ._utils import benchmark_database, measure
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Сравнивает ленту подписок через JOIN по Follow "
+            "и материализованную ленту FeedEntry.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--authors", type=int, default=10000)
+        parser.add_argument("--posts-per-author", type=int, default=3)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            reader = self.seed(options["authors"],
+                               options["posts_per_author"])
+            self.run(reader, options["repeat"])
+
+    def seed(self, authors, posts_per_author):
+        reader = User.objects.create(username="reader")
+        User.objects.bulk_create(
+            [User(username=f"author{i}") for i in range(authors)],
+            batch_size=500)
+        author_ids = list(
+            User.objects.exclude(pk=reader.pk).values_list("id", flat=True))
+        Follow.objects.bulk_create(
+            [Follow(user=reader, author_id=pk) for pk in author_ids],
+            batch_size=500)
+        Post.objects.bulk_create(
+            [Post(author_id=pk, text=f"Пост {n} автора {pk}")
+             for pk in author_ids for n in range(posts_per_author)],
+            batch_size=500)
+        posts = Post.objects.values_list("id", "author", "pub_date")
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user=reader, post_id=post_id, author_id=author_id,
+                       pub_date=pub_date)
+             for post_id, author_id, pub_date in posts],
+            batch_size=500)
+        self.stdout.write(
+            f"Подписок: {authors}, постов: {len(author_ids) * posts_per_author}")
+        return reader
+
+    def run(self, reader, repeat):
+        paths = {
+            "join": lambda: Post.objects.filter(
+                author__following__user=reader),
+            "feed": lambda: FollowFeed(reader),
+        }
+        for name, source in paths.items():
+            for number in (1, 50):
+                def render_page():
+                    page = Paginator(source(), 10).get_page(number)
+                    list(page)
+                elapsed = measure(render_page, repeat)
+                self.stdout.write(
+                    f"{name:>5} page={number:<3} {elapsed:8.2f} ms")
@@ -0,0 +1,55 @@
+import random
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.search import search_posts
+
+from ._utils import benchmark_database, measure
+
+User = get_user_model()
+
+SYLLABLES = ("ка", "ро", "ми", "ту", "ле", "на", "зо", "пи", "ду", "ве")
+
+
+class Command(BaseCommand):
+    help = "Задержка полнотекстового поиска по постам на большом наборе."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--posts", type=int, default=1000000)
+        parser.add_argument("--words", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=20)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+        vocabulary = sorted({
+            "".join(rng.choices(SYLLABLES, k=rng.randint(2, 4)))
+            for _ in range(20000)
+        })
+        # Частоты слов по закону Ципфа, как в естественном тексте.
+        weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+        with benchmark_database():
+            author = User.objects.create(username="author")
+            batch = []
+            for number in range(options["posts"]):
+                words = rng.choices(vocabulary, weights, k=options["words"])
+                batch.append(Post(author=author, text=" ".join(words)))
+                if len(batch) == 5000:
+                    Post.objects.bulk_create(batch)
+                    batch = []
+            Post.objects.bulk_create(batch)
+            self.stdout.write(f"Постов: {options['posts']}")
+            queries = {
+                "частое слово": vocabulary[0],
+                "среднее слово": vocabulary[200],
+                "редкое слово": vocabulary[-1],
+                "два слова": f"{vocabulary[0]} {vocabulary[50]}",
+            }
+            for name, query in queries.items():
+                def first_page():
+                    results = search_posts(query)
+                    results.count()
+                    list(results[:10])
+                elapsed = measure(first_page, options["repeat"])
+                self.stdout.write(f"{name:>14} ({query}): {elapsed:.2f} мс")
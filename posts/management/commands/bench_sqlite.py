@@ -0,0 +1,106 @@
+import os
+import random
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+from ._utils import DUMMY_CACHE, benchmark_database, seed_dataset
+
+# Настройки SQLite по умолчанию: журнал отката, новое соединение на запрос.
+MODES = {
+    "default": ({}, 0),
+    "tuned": (settings.SQLITE_PRAGMAS,
+              settings.DATABASES["default"].get("CONN_MAX_AGE", 0)),
+}
+
+
+class Command(BaseCommand):
+    help = ("Пропускная способность страниц при одновременных чтениях и "
+            "комментариях с настройками SQLite по умолчанию и из "
+            "SQLITE_PRAGMAS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=2)
+        parser.add_argument("--seconds", type=float, default=10)
+        parser.add_argument("--posts", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        for mode, (pragmas, max_age) in MODES.items():
+            with tempfile.TemporaryDirectory() as directory, \
+                    override_settings(SQLITE_PRAGMAS=pragmas):
+                path = os.path.join(directory, "bench.sqlite3")
+                with benchmark_database(DUMMY_CACHE, name=path):
+                    old_max_age = connection.settings_dict["CONN_MAX_AGE"]
+                    connection.settings_dict["CONN_MAX_AGE"] = max_age
+                    try:
+                        seed_dataset(users=50, posts=options["posts"],
+                                     comments=options["posts"])
+                        results = self.run_load(options)
+                    finally:
+                        connection.settings_dict["CONN_MAX_AGE"] = old_max_age
+            seconds = options["seconds"]
+            for kind in ("read", "write"):
+                done, errors = results[kind]
+                self.stdout.write(
+                    f"{mode:>7} {kind:>5}: {done / seconds:8.1f} запр/с, "
+                    f"ошибок {errors}")
+
+    def run_load(self, options):
+        urls = [reverse("index")]
+        urls += [reverse("group_posts", args=[slug])
+                 for slug in Group.objects.values_list("slug", flat=True)]
+        urls += [reverse("profile", args=[username]) for username in
+                 User.objects.values_list("username", flat=True)[:20]]
+        posts = list(Post.objects.values_list(
+            "author__username", "pk")[:200])
+        urls += [reverse("post_detail", args=post) for post in posts]
+        users = list(User.objects.all()[:options["writers"]])
+        connection.close()
+
+        results = {"read": [0, 0], "write": [0, 0]}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options["seconds"]
+
+        def worker(kind, seed, user=None):
+            rng = random.Random(seed)
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            done = errors = 0
+            while time.perf_counter() < deadline:
+                try:
+                    if kind == "read":
+                        response = client.get(rng.choice(urls))
+                    else:
+                        response = client.post(
+                            reverse("add_comment", args=rng.choice(posts)),
+                            {"text": "Нагрузочный комментарий"})
+                    ok = response.status_code < 500
+                except Exception:
+                    ok = False
+                done += ok
+                errors += not ok
+            connections.close_all()
+            with lock:
+                results[kind][0] += done
+                results[kind][1] += errors
+
+        threads = [threading.Thread(target=worker, args=("read", i))
+                   for i in range(options["readers"])]
+        threads += [threading.Thread(target=worker, args=("write", i, user))
+                    for i, user in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
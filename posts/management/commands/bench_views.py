@@ -0,0 +1,87 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from posts.lookups import lookup_stats
+from posts.models import Group, Post, User
+from posts.urls import urlpatterns
+
+from ._utils import DUMMY_CACHE, percentiles
+
+QUERY_STRINGS = {"search": "?q=кот"}
+
+
+class Command(BaseCommand):
+    help = ("Запрашивает каждый URL из posts/urls.py через тестовый клиент "
+            "на текущей базе (заполните её командой seed) и выводит "
+            "p50/p95/p99 задержки, число запросов и размер ответа.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument("--anonymous", action="store_true",
+                            help="Без входа на сайт.")
+        parser.add_argument("--no-cache", action="store_true",
+                            help="Отключить кеш Django.")
+        parser.add_argument("--output", help="Записать результаты в JSON.")
+
+    def handle(self, *args, **options):
+        if options["repeat"] < 2:
+            raise CommandError("--repeat должен быть не меньше 2.")
+        author = User.objects.annotate(
+            total=Count("posts")).order_by("-total").first()
+        if author is None:
+            raise CommandError("В базе нет постов, запустите manage.py seed.")
+        client = Client()
+        if not options["anonymous"]:
+            client.force_login(author)
+        settings = {"CACHES": {"default": {"BACKEND": DUMMY_CACHE}}} \
+            if options["no_cache"] else {}
+        with override_settings(**settings):
+            results = {
+                name: self.measure(client, url, options["repeat"])
+                for name, url in self.urls(author)
+            }
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:>16}: p50 {result['p50']:7.2f} мс, "
+                f"p95 {result['p95']:7.2f} мс, p99 {result['p99']:7.2f} мс, "
+                f"{result['queries']:3} запросов, {result['bytes']:7} байт, "
+                f"код {result['status']}")
+        for name, stats in lookup_stats().items():
+            self.stdout.write(
+                f"Кеш поиска {name}: {stats['hits']} попаданий, "
+                f"{stats['misses']} промахов ({stats['hit_rate']:.1%})")
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(results, output, ensure_ascii=False, indent=2)
+
+    def urls(self, author):
+        post = Post.objects.filter(author=author).order_by(
+            "-comment_count").first()
+        group = Group.objects.annotate(
+            total=Count("posts")).order_by("-total").first()
+        values = {"username": author.username, "post_id": post.pk,
+                  "slug": group.slug if group else "missing"}
+        for pattern in urlpatterns:
+            kwargs = {name: values[name]
+                      for name in pattern.pattern.converters}
+            url = reverse(pattern.name, kwargs=kwargs)
+            yield pattern.name, url + QUERY_STRINGS.get(pattern.name, "")
+
+    def measure(self, client, url, repeat):
+        timings = []
+        for _ in range(repeat):
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                response = client.get(url)
+                timings.append((time.perf_counter() - start) * 1000)
+        return {"url": url, "status": response.status_code,
+                "queries": len(queries), "bytes": len(response.content),
+                **percentiles(timings)}
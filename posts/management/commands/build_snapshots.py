@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import snapshots
+
+
+class Command(BaseCommand):
+    help = ("Пересоздаёт снимки главной, групп и профилей в SNAPSHOT_ROOT "
+            "и удаляет устаревшие.")
+
+    def handle(self, *args, **options):
+        if not settings.SNAPSHOT_ROOT:
+            raise CommandError("SNAPSHOT_ROOT не задан.")
+        written = snapshots.rebuild_all()
+        self.stdout.write(f"Записано снимков: {len(written)}")
@@ -0,0 +1,83 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, reset_queries
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+from ._utils import DUMMY_CACHE, benchmark_database, seed_dataset
+
+
+def problems(plan):
+    """Полные просмотры таблиц и сортировки во временном B-дереве."""
+    found = []
+    for row in plan:
+        detail = row[-1]
+        if detail.startswith("SCAN ") and " USING " not in detail \
+                and "VIRTUAL TABLE" not in detail:
+            found.append(detail)
+        elif "USE TEMP B-TREE" in detail:
+            found.append(detail)
+    return found
+
+
+class Command(BaseCommand):
+    help = ("Выполняет EXPLAIN QUERY PLAN для запросов каждого "
+            "представления на синтетических данных и отмечает полные "
+            "просмотры таблиц и временные сортировки.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=20000)
+
+    def handle(self, *args, **options):
+        with benchmark_database(cache_backend=DUMMY_CACHE):
+            seed_dataset(users=options["users"], posts=options["posts"],
+                         comments=options["comments"])
+            flagged = 0
+            client = Client()
+            for name, url in self.urls(client):
+                reset_queries()
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url)
+                self.stdout.write(self.style.MIGRATE_HEADING(
+                    f"{name} {url}: {len(queries)} запросов"))
+                for query in queries.captured_queries:
+                    sql = query["sql"]
+                    if not sql.startswith("SELECT"):
+                        continue
+                    with connection.cursor() as cursor:
+                        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                        found = problems(cursor.fetchall())
+                    if found:
+                        flagged += 1
+                        self.stdout.write(f"  {sql}")
+                        for detail in found:
+                            self.stdout.write(
+                                self.style.WARNING(f"    {detail}"))
+            style = self.style.WARNING if flagged else self.style.SUCCESS
+            self.stdout.write(style(f"Запросов с проблемами: {flagged}"))
+
+    def urls(self, client):
+        reader = User.objects.annotate(
+            followed=Count("follower")).order_by("-followed").first()
+        author = User.objects.annotate(
+            total=Count("posts")).order_by("-total").first()
+        group = Group.objects.first()
+        post = Post.objects.order_by("-comment_count").first()
+        client.force_login(reader)
+        return [
+            ("index", reverse("index")),
+            ("index", reverse("index") + "?page=50"),
+            ("group_posts", reverse("group_posts", args=[group.slug])),
+            ("profile", reverse("profile", args=[author.username])),
+            ("post_detail", reverse("post_detail",
+                                    args=[post.author.username, post.pk])),
+            ("post_comments", reverse("post_comments",
+                                      args=[post.author.username, post.pk])),
+            ("follow_index", reverse("follow_index")),
+            ("search", reverse("search") + "?q=кот"),
+        ]
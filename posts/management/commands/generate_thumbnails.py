@@ -0,0 +1,32 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ("Создаёт миниатюры для постов, у которых их ещё нет. Посты, "
+            "где это не удалось THUMBNAIL_MAX_ATTEMPTS раз, пропускаются.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Работать постоянно, проверяя очередь раз в --interval с.")
+        parser.add_argument("--interval", type=float, default=2.0)
+
+    def handle(self, *args, **options):
+        while True:
+            pending = (
+                Post.objects.exclude(image="").exclude(image__isnull=True)
+                .filter(thumbnail="",
+                        thumbnail_attempts__lt=settings.THUMBNAIL_MAX_ATTEMPTS)
+                .values_list("pk", flat=True)
+            )
+            for post_id in pending:
+                thumbnails._run(post_id)
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,231 @@
+import bisect
+import http.client
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, \
+    WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.test import Client
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+
+from ._utils import percentiles
+
+# Доли запросов в синтетической смеси по имени URL.
+MIX = {
+    "index": 30, "group_posts": 15, "profile": 15, "post_detail": 20,
+    "follow_index": 5, "add_comment": 8, "new_post": 3,
+    "profile_follow": 2, "profile_unfollow": 2,
+}
+LOGIN_REQUIRED = {"follow_index", "add_comment", "new_post",
+                  "profile_follow", "profile_unfollow"}
+# Верхние границы корзин гистограммы задержек, мс.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+# Django принимает любой токен CSRF правильного вида, если он совпадает
+# в cookie и в форме.
+CSRF_TOKEN = "a" * 64
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _replay(args):
+    """Выполняет операции по HTTP и возвращает (URL, мс, код, байт тела)
+    для каждой. Код 0 — ошибка соединения. С revalidate повторные GET
+    отправляют If-None-Match с ETag прошлого ответа, как браузер."""
+    host, port, ops, sessions, revalidate = args
+    results = []
+    etags = {}
+    for op in ops:
+        cookies = {"csrftoken": CSRF_TOKEN}
+        if op["user"] is not None:
+            cookies["sessionid"] = sessions[op["user"]]
+        headers = {"Cookie": "; ".join(
+            f"{name}={value}" for name, value in cookies.items())}
+        body = None
+        if op["method"] == "POST":
+            body = urlencode(dict(op["data"],
+                                  csrfmiddlewaretoken=CSRF_TOKEN))
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        key = (op["user"], op["path"])
+        if revalidate and op["method"] == "GET" and key in etags:
+            headers["If-None-Match"] = etags[key]
+        start = time.perf_counter()
+        try:
+            connection = http.client.HTTPConnection(host, port, timeout=60)
+            connection.request(op["method"], op["path"], body, headers)
+            response = connection.getresponse()
+            size = len(response.read())
+            status = response.status
+            if response.getheader("ETag"):
+                etags[key] = response.getheader("ETag")
+            connection.close()
+        except (OSError, http.client.HTTPException):
+            status, size = 0, 0
+        results.append((op["endpoint"],
+                        (time.perf_counter() - start) * 1000, status, size))
+    return results
+
+
+class Command(BaseCommand):
+    help = ("Запускает WSGI-приложение в многопоточном локальном сервере "
+            "и воспроизводит на нём смесь просмотров, постов, комментариев "
+            "и подписок из пула потоков или процессов. Работает с текущей "
+            "базой (заполните её командой seed) и пишет в неё.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--workers", type=int, default=8)
+        parser.add_argument("--processes", action="store_true",
+                            help="Пул процессов вместо пула потоков.")
+        parser.add_argument("--users", type=int, default=20,
+                            help="Сколько пользователей входят на сайт.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--record",
+                            help="Воспроизвести операции из JSON-файла.")
+        parser.add_argument("--save",
+                            help="Сохранить операции в JSON-файл.")
+        parser.add_argument("--revalidate", action="store_true",
+                            help="Повторять GET с If-None-Match.")
+        parser.add_argument("--output", help="Записать результаты в JSON.")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.order_by("pk")[:options["users"]])
+        if not users:
+            raise CommandError("В базе нет пользователей, запустите seed.")
+        if options["record"]:
+            with open(options["record"]) as record:
+                ops = json.load(record)
+        else:
+            ops = self.synthetic_ops(users, options["requests"],
+                                     random.Random(options["seed"]))
+        if options["save"]:
+            with open(options["save"], "w") as save:
+                json.dump(ops, save, ensure_ascii=False)
+        sessions = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            sessions.append(client.cookies["sessionid"].value)
+        connections.close_all()
+
+        server = ThreadedWSGIServer(("127.0.0.1", 0), QuietRequestHandler)
+        server.set_app(get_wsgi_application())
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        host, port = server.server_address
+        workers = options["workers"]
+        chunks = [(host, port, ops[i::workers], sessions,
+                   options["revalidate"]) for i in range(workers)]
+        pool = ProcessPoolExecutor if options["processes"] \
+            else ThreadPoolExecutor
+        try:
+            start = time.perf_counter()
+            cpu = time.process_time()
+            with pool(workers) as executor:
+                results = [item for chunk in executor.map(_replay, chunks)
+                           for item in chunk]
+            elapsed = time.perf_counter() - start
+            # С --processes это время одного сервера, с потоками в него
+            # входят и клиенты.
+            cpu = time.process_time() - cpu
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.report(results, elapsed, cpu, options["output"])
+
+    def synthetic_ops(self, users, count, rng):
+        posts = list(Post.objects.order_by("-pub_date").values_list(
+            "author__username", "pk")[:1000])
+        slugs = list(Group.objects.values_list("slug", flat=True))
+        usernames = [user.username for user in users]
+        followed = defaultdict(list)
+        for user, author in Follow.objects.filter(
+                user__in=users).values_list("user", "author__username"):
+            followed[user].append(author)
+        if not posts:
+            raise CommandError("В базе нет постов, запустите seed.")
+        endpoints = [name for name in MIX
+                     if name != "group_posts" or slugs]
+        weights = [MIX[name] for name in endpoints]
+        ops = []
+        for number, endpoint in enumerate(
+                rng.choices(endpoints, weights, k=count)):
+            user = rng.randrange(len(users))
+            if endpoint not in LOGIN_REQUIRED and rng.random() < 0.5:
+                user = None
+            method, data = "GET", {}
+            if endpoint in ("index", "new_post", "follow_index"):
+                args = []
+            elif endpoint == "group_posts":
+                args = [rng.choice(slugs)]
+            elif endpoint == "profile_unfollow" and followed[users[user].pk]:
+                args = [rng.choice(followed[users[user].pk])]
+            elif endpoint in ("profile", "profile_follow",
+                              "profile_unfollow"):
+                args = [rng.choice(usernames)]
+            else:
+                args = list(rng.choice(posts))
+            if endpoint == "add_comment":
+                method, data = "POST", {"text": f"Комментарий {number}"}
+            elif endpoint == "new_post":
+                method, data = "POST", {"text": f"Нагрузочный пост {number}"}
+            ops.append({"endpoint": endpoint, "method": method,
+                        "path": reverse(endpoint, args=args), "data": data,
+                        "user": user})
+        return ops
+
+    def report(self, results, elapsed, cpu, output):
+        by_endpoint = defaultdict(list)
+        for endpoint, latency, status, size in results:
+            by_endpoint[endpoint].append((latency, status, size))
+        summary = {"requests": len(results), "seconds": elapsed,
+                   "throughput": len(results) / elapsed, "cpu_seconds": cpu,
+                   "bytes": sum(item[3] for item in results),
+                   "not_modified": sum(item[2] == 304 for item in results),
+                   "endpoints": {}}
+        self.stdout.write(
+            f"{len(results)} запросов за {elapsed:.1f} с: "
+            f"{summary['throughput']:.1f} запр/с, процессор {cpu:.1f} с, "
+            f"{summary['bytes']} байт, ответов 304: "
+            f"{summary['not_modified']}")
+        for endpoint, items in sorted(by_endpoint.items()):
+            latencies = [latency for latency, _, _ in items]
+            errors = sum(1 for _, status, _ in items
+                         if not 200 <= status < 400)
+            histogram = [0] * (len(BUCKETS) + 1)
+            for latency in latencies:
+                histogram[bisect.bisect_left(BUCKETS, latency)] += 1
+            stats = {"count": len(items), "errors": errors,
+                     "error_rate": errors / len(items),
+                     "bytes": sum(size for _, _, size in items),
+                     "histogram": dict(zip(
+                         [str(bound) for bound in BUCKETS] + ["inf"],
+                         histogram))}
+            if len(latencies) > 1:
+                stats.update(percentiles(latencies))
+            summary["endpoints"][endpoint] = stats
+            line = f"{endpoint:>16}: {len(items):5} запр., ошибок " \
+                   f"{stats['error_rate']:6.1%}"
+            if "p50" in stats:
+                line += (f", p50 {stats['p50']:7.1f} мс, "
+                         f"p95 {stats['p95']:7.1f} мс, "
+                         f"p99 {stats['p99']:7.1f} мс")
+            self.stdout.write(line)
+            self.stdout.write("    " + " ".join(
+                f"≤{bound}:{count}" for bound, count
+                in stats["histogram"].items() if count))
+        if output:
+            with open(output, "w") as handle:
+                json.dump(summary, handle, ensure_ascii=False, indent=2)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счётчики постов и пользователей."
+
+    def handle(self, *args, **options):
+        for field, fixed in reconcile().items():
+            self.stdout.write(f"{field}: исправлено {fixed}")
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import feed
+
+
+class Command(BaseCommand):
+    help = ("Снова раскладывает по лентам посты авторов, у которых "
+            "подписчиков стало не больше FEED_FANOUT_RESTORE_FOLLOWERS.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Работать постоянно, проверяя очередь раз в --interval с.")
+        parser.add_argument("--interval", type=float, default=60.0)
+
+    def handle(self, *args, **options):
+        while True:
+            for author in list(feed.pending_restores()):
+                feed.restore_fan_out(author)
+                self.stdout.write(f"Ленты восстановлены для автора {author}")
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
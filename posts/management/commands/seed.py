@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from posts.caching import bump_generation
+
+from ._utils import seed_dataset
+
+
+class Command(BaseCommand):
+    help = ("Заполняет базу синтетическими пользователями, группами, "
+            "постами, комментариями и подписками. Авторы и популярность "
+            "распределены по закону Ципфа.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=50)
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--comments", type=int, default=200000)
+        parser.add_argument("--follows", type=int, default=20,
+                            help="Подписок на пользователя.")
+        parser.add_argument("--zipf", type=float, default=1.1,
+                            help="Показатель распределения Ципфа.")
+        parser.add_argument("--days", type=int, default=365,
+                            help="За сколько дней разбросаны даты.")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        created = seed_dataset(
+            users=options["users"], groups=options["groups"],
+            posts=options["posts"], comments=options["comments"],
+            follows=options["follows"], zipf=options["zipf"],
+            days=options["days"], seed=options["seed"])
+        # Закешированные страницы лент больше не соответствуют базе.
+        bump_generation()
+        self.stdout.write(", ".join(
+            f"{name}: {count}" for name, count in created.items()))
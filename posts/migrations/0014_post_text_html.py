@@ -0,0 +1,56 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:20
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+from posts.text import render_text
+
+fts = import_module('posts.migrations.0011_post_fts')
+# SQLite пересоздаёт posts_post при добавлении и удалении полей, и
+# триггеры полнотекстового индекса пропадают вместе со старой таблицей.
+# Содержимое индекса остаётся верным: id постов не меняются.
+restore_triggers = fts.run(fts.DROP[:3] + fts.CREATE[1:-1])
+
+
+def render_texts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    batch = []
+    for post in Post.objects.only('id', 'text').iterator(chunk_size=1000):
+        post.text_html, post.preview_html, post.text_truncated = \
+            render_text(post.text)
+        batch.append(post)
+        if len(batch) == 1000:
+            Post.objects.bulk_update(
+                batch, ['text_html', 'preview_html', 'text_truncated'])
+            batch = []
+    Post.objects.bulk_update(
+        batch, ['text_html', 'preview_html', 'text_truncated'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_profiling'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='preview_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_html',
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='text_truncated',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+        migrations.RunPython(render_texts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-18 03:22
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+fts = import_module('posts.migrations.0011_post_fts')
+# SQLite пересоздаёт posts_post при добавлении поля, триггеры
+# полнотекстового индекса нужно вернуть (см. 0014_post_text_html).
+restore_triggers = fts.run(fts.DROP[:3] + fts.CREATE[1:-1])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_text_html'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_attempts',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -14,6 +14,10 @@ class Group(models.Model):
         return self.title
 
 
+# Поля, которые не нужны спискам постов: ленты показывают preview_html.
+LIST_DEFERRED = ("text", "text_html")
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField("date published", auto_now_add=True)
@@ -24,12 +28,31 @@ class Post(models.Model):
         null=True
     )
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    image_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False)
+    image_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False)
+    image_format = models.CharField(max_length=10, blank=True, editable=False)
+    thumbnail = models.CharField(max_length=255, blank=True, editable=False)
+    # Неудачные попытки создать миниатюру, см. THUMBNAIL_MAX_ATTEMPTS.
+    thumbnail_attempts = models.PositiveSmallIntegerField(
+        default=0, editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)
+    # Экранированный HTML текста и превью для лент, см. posts/text.py.
+    text_html = models.TextField(blank=True, editable=False)
+    preview_html = models.TextField(blank=True, editable=False)
+    text_truncated = models.BooleanField(default=False, editable=False)
 
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(fields=["-pub_date"]),
+            models.Index(fields=["author", "-pub_date"]),
+            models.Index(fields=["group", "-pub_date"]),
+        ]
 
 
 class Comment(models.Model):
@@ -45,6 +68,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["post", "-created", "-id"]),
+        ]
 
 
 class Follow(models.Model):
@@ -52,3 +78,73 @@ class Follow(models.Model):
         User, on_delete=models.CASCADE, related_name="follower")
     author = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name="following")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "author"],
+                                    name="unique_follow"),
+        ]
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="feed_entries")
+    post = models.ForeignKey(
+        Post, on_delete=models.CASCADE, related_name="feed_entries")
+    author = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name="+")
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-pub_date", "-post_id")
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-pub_date", "-post"]),
+            models.Index(fields=["user", "author"]),
+        ]
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(
+        User, on_delete=models.CASCADE, primary_key=True,
+        related_name="stats")
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Посты автора подмешиваются в ленты при чтении. Снимается только
+    # после того, как manage.py restore_fan_out разложит их по лентам.
+    feed_pulled = models.BooleanField(default=False)
+
+
+class RequestProfile(models.Model):
+    """Результат cProfile для запроса, запущенного с ?profile=1."""
+    created = models.DateTimeField(auto_now_add=True)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, related_name="+")
+    duration = models.FloatField("время, мс")
+    stats = models.TextField()
+
+    class Meta:
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.path} ({self.duration:.0f} мс)"
+
+
+class SlowQuery(models.Model):
+    """SQL-запрос дольше settings.SLOW_QUERY_THRESHOLD_MS и его план."""
+    created = models.DateTimeField(auto_now_add=True)
+    path = models.CharField(max_length=2000)
+    view_name = models.CharField(max_length=200, blank=True)
+    database = models.CharField(max_length=100)
+    sql = models.TextField()
+    duration = models.FloatField("время, мс")
+    plan = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ("-created",)
+
+    def __str__(self):
+        return f"{self.view_name or self.path} ({self.duration:.0f} мс)"
@@ -0,0 +1,219 @@
+import calendar
+import datetime
+
+from django.conf import settings
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, \
+    Paginator
+from django.db.models import Q
+from django.utils import timezone
+
+
+def encode_cursor(obj, date_field="pub_date"):
+    value = getattr(obj, date_field)
+    micros = (calendar.timegm(value.utctimetuple()) * 10 ** 6
+              + value.microsecond)
+    return f"{micros}.{obj.pk}"
+
+
+def decode_cursor(token):
+    try:
+        micros, pk = (int(part) for part in token.split("."))
+        seconds, microsecond = divmod(micros, 10 ** 6)
+        value = datetime.datetime.fromtimestamp(seconds, timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        return None
+    return value.replace(microsecond=microsecond), pk
+
+
+def keyset_filter(queryset, key, forward, fields=("pub_date", "id")):
+    """Записи строго после (forward) или до ключа в порядке убывания
+    (дата, id). Для forward=False порядок возрастающий."""
+    date_field, pk_field = fields
+    if forward:
+        ordering = (f"-{date_field}", f"-{pk_field}")
+        lookup = "lt"
+    else:
+        ordering = (date_field, pk_field)
+        lookup = "gt"
+    queryset = queryset.order_by(*ordering)
+    if key is None:
+        return queryset
+    value, pk = key
+    return queryset.filter(
+        Q(**{f"{date_field}__{lookup}": value})
+        | Q(**{date_field: value, f"{pk_field}__{lookup}": pk})
+    )
+
+
+class CursorPage:
+    def __init__(self, object_list, has_next, has_previous,
+                 date_field="pub_date"):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.date_field = date_field
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def next_cursor(self):
+        if not self._has_next:
+            return ""
+        return encode_cursor(self.object_list[-1], self.date_field)
+
+    def previous_cursor(self):
+        if not self._has_previous:
+            return ""
+        return encode_cursor(self.object_list[0], self.date_field)
+
+
+class CursorPaginator:
+    """Пагинация по ключу (дата, id) без COUNT и OFFSET: стоимость
+    страницы не зависит от её глубины.
+
+    object_list — queryset или объект с методом keyset(key, forward,
+    limit), например FollowFeed. fields — поля ключа в queryset.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, fields=("pub_date", "id")):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.fields = fields
+
+    def _fetch(self, key, forward):
+        limit = self.per_page + 1
+        if hasattr(self.object_list, "keyset"):
+            return self.object_list.keyset(key, forward, limit)
+        queryset = keyset_filter(self.object_list, key, forward, self.fields)
+        return list(queryset[:limit])
+
+    def _page(self, items, has_next, has_previous):
+        return CursorPage(items, has_next, has_previous, self.fields[0])
+
+    def page(self, after=None, before=None):
+        if before is not None:
+            items = self._fetch(before, forward=False)
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            return self._page(items, has_next=True, has_previous=has_previous)
+        items = self._fetch(after, forward=True)
+        return self._page(items[:self.per_page],
+                          has_next=len(items) > self.per_page,
+                          has_previous=after is not None)
+
+
+class UncountedPage(Page):
+    def __init__(self, object_list, number, paginator, has_next):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+
+    def has_next(self):
+        return self._has_next
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+    def start_index(self):
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        return self.start_index() + len(self.object_list) - 1
+
+
+class UncountedPaginator(Paginator):
+    """Постраничная навигация без COUNT(*): есть ли следующая страница,
+    узнаём по лишней записи. Номер последней страницы неизвестен."""
+    is_uncounted = True
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger("Номер страницы должен быть числом.")
+        if number < 1:
+            raise EmptyPage("Номер страницы меньше 1.")
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items and number > 1:
+            raise EmptyPage("На этой странице нет результатов.")
+        return UncountedPage(items[:self.per_page], number, self,
+                             has_next=len(items) > self.per_page)
+
+    def get_page(self, number):
+        try:
+            return self.page(number)
+        except (PageNotAnInteger, EmptyPage):
+            return self.page(1)
+
+
+def page_window(page, size=None):
+    """Номера страниц для навигации: окно вокруг текущей, первая и
+    последняя. None обозначает пропуск. Последняя страница у
+    UncountedPaginator неизвестна, тогда после окна идёт пропуск."""
+    size = settings.PAGINATION_WINDOW if size is None else size
+    number = page.number
+    uncounted = getattr(page.paginator, "is_uncounted", False)
+    if uncounted:
+        last = number + 1 if page.has_next() else number
+    else:
+        last = page.paginator.num_pages
+    start, stop = max(1, number - size), min(last, number + size)
+    pages = list(range(start, stop + 1))
+    if start > 1:
+        pages = [1] + [None] * (start > 2) + pages
+    if uncounted:
+        pages += [None] * page.has_next()
+    elif stop < last:
+        pages += [None] * (stop < last - 1) + [last]
+    return pages
+
+
+def paginate(request, object_list, per_page=10):
+    """Возвращает (paginator, page).
+
+    ?after=/?before= всегда включают курсорный режим, ?page= — обычный
+    постраничный. Без параметров курсор используют только представления
+    из settings.CURSOR_PAGINATION_VIEWS. Представления из
+    settings.UNCOUNTED_PAGINATION_VIEWS листаются по номерам без COUNT(*).
+    """
+    after = decode_cursor(request.GET.get("after", ""))
+    before = decode_cursor(request.GET.get("before", ""))
+    match = request.resolver_match
+    cursor_view = (match is not None
+                   and match.url_name in settings.CURSOR_PAGINATION_VIEWS)
+    if (after or before or cursor_view) and "page" not in request.GET:
+        paginator = CursorPaginator(object_list, per_page)
+        return paginator, paginator.page(after=after, before=before)
+    uncounted = (match is not None
+                 and match.url_name in settings.UNCOUNTED_PAGINATION_VIEWS)
+    if uncounted:
+        paginator = UncountedPaginator(object_list, per_page)
+    else:
+        paginator = Paginator(object_list, per_page)
+    return paginator, paginator.get_page(request.GET.get("page"))
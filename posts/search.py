@@ -0,0 +1,53 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Post
+
+FTS_TABLE = "posts_post_fts"
+WORD_RE = re.compile(r"\w+")
+
+
+def fts_query(query):
+    """Превращает пользовательский ввод в выражение FTS5: каждое слово
+    в кавычках, все слова обязательны. Операторы FTS5 из ввода не
+    интерпретируются."""
+    return " ".join(f'"{word}"' for word in WORD_RE.findall(query))
+
+
+def search_posts(query, queryset=None, capped=True):
+    """Посты, содержащие все слова запроса, от наиболее релевантных среди
+    SEARCH_MAX_RESULTS самых новых. С capped=False ранжируются все
+    совпадения, например для поиска в админке.
+
+    На SQLite использует индекс FTS5, который триггеры держат в
+    соответствии с posts_post (см. миграцию 0011_post_fts).
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    match = fts_query(query)
+    if not match:
+        return queryset.none()
+    if connection.vendor != "sqlite":
+        for word in WORD_RE.findall(query):
+            queryset = queryset.filter(text__icontains=word)
+        return queryset
+    # Ранжируются только самые свежие совпадения: FTS5 читает их по
+    # убыванию rowid и останавливается, поэтому частые слова не заставляют
+    # считать bm25 по всему индексу.
+    where = [f"{FTS_TABLE}.rowid = posts_post.id", f"{FTS_TABLE} MATCH %s"]
+    params = [match]
+    if capped:
+        where.append(
+            f"{FTS_TABLE}.rowid >= (SELECT min(rowid) FROM (SELECT rowid "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY rowid DESC LIMIT %s))")
+        params += [match, settings.SEARCH_MAX_RESULTS]
+    return queryset.extra(
+        tables=[FTS_TABLE],
+        where=where,
+        params=params,
+        select={"rank": f"{FTS_TABLE}.rank"},
+        order_by=["rank", "-pub_date"],
+    )
@@ -0,0 +1,227 @@
+from django.conf import settings
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.urls import reverse
+
+from yatube import cache_control
+
+from . import counters, feed, lookups, snapshots
+from .caching import FOLLOWS_GENERATION_KEY, bump_generation
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .text import render_text
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def forget_lookup(sender, instance, **kwargs):
+    lookups.forget(sender, instance)
+
+
+@receiver(pre_save, sender=User)
+def invalidate_renamed(sender, instance, update_fields=None, **kwargs):
+    # Имя автора есть в кешированных лентах и комментариях. При входе
+    # сохраняется только last_login, базу тогда не спрашиваем.
+    instance.previous_username = None
+    if not instance.pk or (update_fields is not None
+                           and "username" not in update_fields):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        "username", flat=True).first()
+    if previous is not None and previous != instance.username:
+        instance.previous_username = previous
+        bump_generation()
+
+
+@receiver(pre_save, sender=Post)
+def render_post_text(sender, instance, **kwargs):
+    (instance.text_html, instance.preview_html,
+     instance.text_truncated) = render_text(instance.text)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_feeds(sender, **kwargs):
+    bump_generation()
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follows(sender, **kwargs):
+    bump_generation(FOLLOWS_GENERATION_KEY)
+
+
+@receiver(pre_save, sender=Post)
+def remember_group(sender, instance, **kwargs):
+    # Если пост перенесли в другую группу, снимки и копии в кеше прокси
+    # прежней тоже устарели.
+    if (settings.SNAPSHOT_ROOT or settings.CACHE_PURGE_URL) and instance.pk:
+        instance.previous_group = Group.objects.filter(
+            posts=instance.pk).first()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def update_group_snapshots(sender, instance, **kwargs):
+    if settings.SNAPSHOT_ROOT:
+        snapshots.schedule([reverse("index"),
+                            reverse("group_posts", args=[instance.slug])])
+
+
+def _post_pages(post, group=None):
+    return snapshots.post_paths(post, group) + [
+        reverse("post_detail", args=[post.author.username, post.pk])]
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def purge_post_pages(sender, instance, **kwargs):
+    if settings.CACHE_PURGE_URL:
+        cache_control.purge(_post_pages(
+            instance, getattr(instance, "previous_group", None)))
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def purge_comment_pages(sender, instance, **kwargs):
+    # Число комментариев видно и в лентах.
+    if settings.CACHE_PURGE_URL:
+        cache_control.purge(_post_pages(instance.post))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def purge_group_pages(sender, instance, **kwargs):
+    if settings.CACHE_PURGE_URL:
+        cache_control.purge([reverse("index"),
+                             reverse("group_posts", args=[instance.slug])])
+
+
+def _author_pages(user):
+    # Старые страницы постов устареют в прокси сами, через s-maxage.
+    post_ids = user.posts.values_list(
+        "pk", flat=True)[:settings.CACHE_PURGE_AUTHOR_POSTS]
+    return [reverse("profile", args=[user.username])] + [
+        reverse("post_detail", args=[user.username, post_id])
+        for post_id in post_ids]
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_follow_pages(sender, instance, **kwargs):
+    # Числа подписчиков и подписок видны в профиле и на страницах постов.
+    if settings.CACHE_PURGE_URL:
+        cache_control.purge(_author_pages(instance.author)
+                            + _author_pages(instance.user))
+
+
+@receiver(post_save, sender=User)
+def purge_renamed_pages(sender, instance, **kwargs):
+    previous = instance.previous_username
+    if not settings.CACHE_PURGE_URL or previous is None:
+        return
+    paths = snapshots.author_paths(instance, previous)
+    paths += [reverse("post_detail", args=[previous, post_id])
+              for post_id in instance.posts.values_list("pk", flat=True)]
+    # Имя видно и в комментариях к чужим постам.
+    paths += [reverse("post_detail", args=[post.author.username, post.pk])
+              for post in Post.objects.filter(comments__author=instance)
+              .select_related("author").distinct()]
+    cache_control.purge(dict.fromkeys(paths))
+
+
+@receiver(post_delete, sender=User)
+def purge_deleted_profile(sender, instance, **kwargs):
+    # Страницы постов сбрасывают удаления постов и комментариев.
+    if settings.CACHE_PURGE_URL:
+        cache_control.purge([reverse("profile", args=[instance.username])])
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_stats(instance.author_id, "posts_count", 1)
+        feed.fan_out(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    counters.bump_stats(instance.author_id, "posts_count", -1)
+
+
+# Подключается после счётчиков: в автокоммите on_commit срабатывает
+# сразу, и снимок профиля должен увидеть новое число записей.
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def update_post_snapshots(sender, instance, **kwargs):
+    if settings.SNAPSHOT_ROOT:
+        snapshots.schedule(snapshots.post_paths(
+            instance, getattr(instance, "previous_group", None)))
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    counters.bump_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def update_comment_snapshots(sender, instance, **kwargs):
+    # Число комментариев видно в лентах.
+    if settings.SNAPSHOT_ROOT:
+        snapshots.schedule(snapshots.post_paths(instance.post))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_stats(instance.author_id, "followers_count", 1)
+        counters.bump_stats(instance.user_id, "following_count", 1)
+        feed.mark_pulled(instance.author_id)
+        feed.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    counters.bump_stats(instance.author_id, "followers_count", -1)
+    counters.bump_stats(instance.user_id, "following_count", -1)
+    feed.prune(instance.user, instance.author)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def update_follow_snapshots(sender, instance, **kwargs):
+    if settings.SNAPSHOT_ROOT:
+        snapshots.schedule([reverse("profile", args=[user.username])
+                            for user in (instance.author, instance.user)])
+
+
+@receiver(post_save, sender=User)
+def update_renamed_snapshots(sender, instance, **kwargs):
+    if settings.SNAPSHOT_ROOT and instance.previous_username is not None:
+        snapshots.schedule(snapshots.author_paths(
+            instance, instance.previous_username))
+
+
+@receiver(post_delete, sender=User)
+def update_deleted_snapshots(sender, instance, **kwargs):
+    # Ленты и группы обновят удаления постов, здесь убирается профиль.
+    if settings.SNAPSHOT_ROOT:
+        snapshots.schedule([reverse("profile", args=[instance.username])])
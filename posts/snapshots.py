@@ -0,0 +1,236 @@
+import inspect
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import close_old_connections, transaction
+from django.http import Http404, HttpResponse
+from django.test import RequestFactory
+from django.urls import Resolver404, resolve, reverse
+
+from yatube.db import use_primary
+
+from .models import Group, Post, User
+
+# Представления, первые SNAPSHOT_PAGES страниц которых сохраняются.
+SNAPSHOT_VIEWS = ("index", "group_posts", "profile")
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+def _get_executor():
+    # Один поток: снимки пересоздаются по очереди, не в потоке запроса.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix="snapshots")
+    return _executor
+
+
+def snapshot_file(path, page=1):
+    """Файл снимка страницы page по пути path: <путь>/index.html для
+    первой страницы и <путь>/page-<номер>.html для остальных. Фронтенд
+    может отдавать их сам, например try_files в nginx. None, если путь
+    выходит за пределы SNAPSHOT_ROOT."""
+    root = os.path.abspath(settings.SNAPSHOT_ROOT)
+    name = "index.html" if page == 1 else f"page-{page}.html"
+    filename = os.path.normpath(os.path.join(root, path.strip("/"), name))
+    if not filename.startswith(root + os.sep):
+        return None
+    return filename
+
+
+def _write(filename, content):
+    # Запись во временный файл рядом и os.replace: читатель видит либо
+    # старый снимок, либо новый целиком.
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(filename),
+                                     suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as handle:
+            handle.write(content)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, filename)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def _remove(filename):
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
+def _render(match, path, page):
+    request = RequestFactory().get(path, {"page": page} if page > 1 else {})
+    request.user = AnonymousUser()
+    request.resolver_match = match
+    # Мимо кеша лент: в нём может лежать страница прошлого поколения.
+    view = inspect.unwrap(match.func)
+    try:
+        with use_primary():
+            response = view(request, *match.args, **match.kwargs)
+    except Http404:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.content
+
+
+def rebuild(paths):
+    """Пересоздаёт снимки первых SNAPSHOT_PAGES страниц по путям paths и
+    возвращает множество записанных файлов. Снимки страниц, которых
+    больше нет, удаляются."""
+    written = set()
+    for path in paths:
+        try:
+            match = resolve(path)
+        except Resolver404:
+            match = None
+        if match is None or match.url_name not in SNAPSHOT_VIEWS:
+            continue
+        previous = None
+        for page in range(1, settings.SNAPSHOT_PAGES + 1):
+            filename = snapshot_file(path, page)
+            if filename is None:
+                break
+            content = _render(match, path, page)
+            # За последней страницей пагинатор снова отдаёт её же.
+            if content is None or content == previous:
+                _remove(filename)
+                continue
+            _write(filename, content)
+            written.add(filename)
+            previous = content
+        # Каталог страницы, которой больше нет, например профиля
+        # переименованного пользователя.
+        if previous is None and filename is not None:
+            try:
+                os.rmdir(os.path.dirname(filename))
+            except OSError:
+                pass
+    return written
+
+
+def rebuild_all():
+    """Пересоздаёт все снимки и удаляет файлы, которые больше не нужны,
+    например страницы удалённых или переименованных пользователей."""
+    paths = [reverse("index")]
+    paths += [reverse("group_posts", args=[slug]) for slug
+              in Group.objects.values_list("slug", flat=True)]
+    paths += [reverse("profile", args=[username]) for username
+              in User.objects.values_list("username", flat=True)]
+    written = rebuild(paths)
+    root = os.path.abspath(settings.SNAPSHOT_ROOT)
+    for directory, _, files in os.walk(root, topdown=False):
+        for name in files:
+            filename = os.path.abspath(os.path.join(directory, name))
+            if filename not in written:
+                _remove(filename)
+        if directory != root and not os.listdir(directory):
+            os.rmdir(directory)
+    return written
+
+
+def post_paths(post, group=None):
+    """Пути страниц, на которых виден пост. group — прежняя группа, если
+    пост из неё перенесли."""
+    paths = [reverse("index"),
+             reverse("profile", args=[post.author.username])]
+    for item in (post.group, group):
+        if item is not None:
+            paths.append(reverse("group_posts", args=[item.slug]))
+    return list(dict.fromkeys(paths))
+
+
+def author_paths(user, username=None):
+    """Пути страниц, на которых видно имя пользователя. username —
+    прежнее имя, если пользователя переименовали."""
+    paths = [reverse("index"), reverse("profile", args=[user.username])]
+    if username is not None:
+        paths.append(reverse("profile", args=[username]))
+    paths += [reverse("group_posts", args=[slug]) for slug
+              in Group.objects.filter(posts__author=user).values_list(
+                  "slug", flat=True).distinct()]
+    return list(dict.fromkeys(paths))
+
+
+def _run(paths):
+    try:
+        rebuild(paths)
+    except Exception:
+        logger.exception("Не удалось обновить снимки %s", paths)
+    finally:
+        close_old_connections()
+
+
+def _submit(paths):
+    _get_executor().submit(_run, paths)
+
+
+def schedule(paths):
+    """Ставит обновление снимков paths в фоновый поток после коммита
+    транзакции. Ничего не делает, если SNAPSHOT_ROOT не задан."""
+    if settings.SNAPSHOT_ROOT:
+        paths = list(paths)
+        transaction.on_commit(lambda: _submit(paths))
+
+
+def schedule_post(post_id):
+    if settings.SNAPSHOT_ROOT:
+        post = Post.objects.select_related("author", "group").filter(
+            pk=post_id).first()
+        if post is not None:
+            schedule(post_paths(post))
+
+
+class SnapshotMiddleware:
+    """Отдаёт анонимным GET-запросам готовый снимок страницы, не трогая
+    сессию, базу и шаблоны.
+
+    Запрос с cookie сессии или с параметрами, кроме ?page=, проходит
+    дальше в Django.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if (settings.SNAPSHOT_ROOT and request.method in ("GET", "HEAD")
+                and settings.SESSION_COOKIE_NAME not in request.COOKIES):
+            response = self.serve(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request):
+        if set(request.GET) - {"page"}:
+            return None
+        page = request.GET.get("page", "1")
+        if not page.isdigit():
+            return None
+        page = int(page)
+        if not 1 <= page <= settings.SNAPSHOT_PAGES:
+            return None
+        filename = snapshot_file(request.path_info, page)
+        if filename is None:
+            return None
+        try:
+            with open(filename, "rb") as handle:
+                content = handle.read()
+        except OSError:
+            return None
+        # Для метрик по имени URL.
+        try:
+            request.resolver_match = resolve(request.path_info)
+        except Resolver404:
+            pass
+        response = HttpResponse(content)
+        response["X-Snapshot"] = "1"
+        return response
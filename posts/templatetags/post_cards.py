@@ -0,0 +1,15 @@
+from django import template
+
+from posts.fragments import render_cards
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts, preview=False):
+    return render_cards(context["request"], posts, preview)
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post, preview=False):
+    return render_cards(context["request"], [post], preview)[0]
@@ -1,19 +1,60 @@
+import datetime as dt
+import json
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+from io import BytesIO, StringIO
+
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files import File
-from django.test import TestCase, Client
-from django.urls import reverse
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.db import IntegrityError, connection, connections
+from django.test import (TestCase, TransactionTestCase, Client,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
 
-from .models import Post, Group, Follow
+from . import fragments, lookups, snapshots, thumbnails
+from .caching import cache_stats, feed_cache_key
+from .feed import FollowFeed, is_pulled
+from .forms import PostForm
+from .management.commands.explain_queries import problems
+from .models import (Post, Group, Comment, Follow, FeedEntry,
+                     RequestProfile, SlowQuery, UserStats)
+from .paginator import page_window
+from .search import search_posts
 
 import mock
+from PIL import Image
+
+from yatube import metrics
+from yatube.db import STICKY_COOKIE
 
 User = get_user_model()
 
 
+class QueryBudgetMixin:
+    def assertQueryBudget(self, client, url):
+        budget = resolve(url).func.query_budget
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(
+            len(queries), budget,
+            f'{url} превысил бюджет запросов:\n' + '\n'.join(
+                query['sql'] for query in queries.captured_queries))
+        return len(queries)
+
+
 class DefaultSetUp(TestCase):
     def defaultSetUp(self):
         cache.clear()
+        lookups.clear()
         self.auth_client = Client()
         self.client_logout = Client()
         self.user = User.objects.create_user(
@@ -195,3 +236,1034 @@ class TestFollow(DefaultSetUp):
         )
         self.assertEqual(response.status_code, 200)
         self.assertNotContains(response, 'comment test')
+
+
+class TestFeed(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.other_user = User.objects.create_user(username='Lola')
+
+    def test_fan_out_and_prune(self):
+        Follow.objects.create(user=self.user, author=self.other_user)
+        post = Post.objects.create(text='Fan out', author=self.other_user)
+        self.assertTrue(
+            FeedEntry.objects.filter(user=self.user, post=post).exists())
+        self.auth_client.get(
+            reverse('profile_unfollow', args=[self.other_user.username]))
+        self.assertFalse(FeedEntry.objects.filter(user=self.user).exists())
+
+    def test_backfill_on_follow(self):
+        Post.objects.create(text='Old post', author=self.other_user)
+        self.auth_client.get(
+            reverse('profile_follow', args=[self.other_user.username]))
+        response = self.auth_client.get(reverse('follow_index'))
+        self.assertContains(response, 'Old post')
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_pull_merge_for_popular_author(self):
+        third_user = User.objects.create_user(username='Ted')
+        Follow.objects.create(user=self.user, author=self.other_user)
+        Follow.objects.create(user=self.user, author=third_user)
+        Post.objects.create(text='Pulled post', author=self.other_user)
+        Post.objects.create(text='Second pulled', author=third_user)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.auth_client.get(reverse('follow_index'))
+        self.assertEqual(len(response.context['page']), 2)
+        self.assertContains(response, 'Pulled post')
+        self.assertContains(response, 'Second pulled')
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1,
+                       FEED_FANOUT_RESTORE_FOLLOWERS=0)
+    def test_author_dropping_below_threshold_is_fanned_out(self):
+        third_user = User.objects.create_user(username='Ted')
+        Follow.objects.create(user=self.user, author=self.other_user)
+        Follow.objects.create(user=third_user, author=self.other_user)
+        post = Post.objects.create(text='Pulled post', author=self.other_user)
+        Follow.objects.get(user=third_user).delete()
+        # Подписчиков выше порога возврата: автор по-прежнему подмешивается.
+        call_command('restore_fan_out', stdout=StringIO())
+        self.assertTrue(is_pulled(self.other_user))
+        response = self.auth_client.get(reverse('follow_index'))
+        self.assertContains(response, 'Pulled post')
+        with self.settings(FEED_FANOUT_RESTORE_FOLLOWERS=1):
+            call_command('restore_fan_out', stdout=StringIO())
+        self.assertFalse(is_pulled(self.other_user))
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.assertFalse(FeedEntry.objects.filter(user=third_user).exists())
+        response = self.auth_client.get(reverse('follow_index'))
+        self.assertContains(response, 'Pulled post')
+
+
+class TestQueryPlans(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.other_user = User.objects.create_user(username='Lola')
+        Follow.objects.create(user=self.user, author=self.other_user)
+        self.post = Post.objects.create(text='Post', author=self.other_user)
+
+    def assertPlanClean(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            self.assertEqual(problems(cursor.fetchall()), [])
+
+    def test_feed_and_comments_use_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            FollowFeed(self.user).keyset(None, True, 11)
+        feed_sql = [query['sql'] for query in queries.captured_queries
+                    if 'posts_feedentry' in query['sql']]
+        self.assertNotIn('posts_post', feed_sql[0])
+        self.assertPlanClean(
+            FeedEntry.objects.filter(user=self.user)
+            .order_by('-pub_date', '-post_id'))
+        self.assertPlanClean(
+            self.post.comments.order_by('-created', '-id')[:21])
+
+    def test_follow_is_unique(self):
+        with self.assertRaises(IntegrityError):
+            Follow.objects.create(user=self.user, author=self.other_user)
+
+
+class TestSQLiteTuning(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'busy_timeout': 1234,
+                                       'cache_size': -2000})
+    def test_pragmas_applied_on_connect(self):
+        new_connection = connection.copy()
+        try:
+            with new_connection.cursor() as cursor:
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 1234)
+                cursor.execute('PRAGMA cache_size')
+                self.assertEqual(cursor.fetchone()[0], -2000)
+        finally:
+            new_connection.close()
+
+
+@override_settings(DATABASE_READ_ALIASES=['replica'])
+class TestReadReplica(TransactionTestCase):
+    """Реплику заменяет копия тестовой базы во временном файле. Копировать
+    можно только зафиксированные данные, поэтому без TestCase."""
+
+    def setUp(self):
+        cache.clear()
+        self.client_logout = Client()
+        self.auth_client = Client()
+        self.user = User.objects.create_user(username='Barney')
+        self.auth_client.force_login(self.user)
+        Post.objects.create(text='Replicated', author=self.user)
+        descriptor, self.replica_path = tempfile.mkstemp(suffix='.sqlite3')
+        os.close(descriptor)
+        self.sync_replica()
+        connections.databases['replica'] = dict(
+            connection.settings_dict, NAME=self.replica_path)
+        self.profile_url = reverse('profile', args=[self.user.username])
+
+    def tearDown(self):
+        connections['replica'].close()
+        del connections.databases['replica']
+        delattr(connections._connections, 'replica')
+        os.remove(self.replica_path)
+
+    def sync_replica(self):
+        connection.ensure_connection()
+        target = sqlite3.connect(self.replica_path)
+        try:
+            connection.connection.backup(target)
+        finally:
+            target.close()
+
+    def test_reads_go_to_replica(self):
+        Post.objects.create(text='Not replicated yet', author=self.user)
+        response = self.client_logout.get(self.profile_url)
+        self.assertContains(response, 'Replicated')
+        self.assertNotContains(response, 'Not replicated yet')
+        self.sync_replica()
+        response = self.client_logout.get(self.profile_url)
+        self.assertContains(response, 'Not replicated yet')
+
+    def test_writer_reads_own_writes(self):
+        response = self.auth_client.post(reverse('new_post'),
+                                         data={'text': 'Fresh post'})
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertContains(self.auth_client.get(self.profile_url),
+                            'Fresh post')
+        self.assertNotContains(self.client_logout.get(self.profile_url),
+                               'Fresh post')
+
+    def test_replica_pages_get_no_etag(self):
+        response = self.client_logout.get(self.profile_url)
+        self.assertContains(response, 'Replicated')
+        self.assertFalse(response.has_header('ETag'))
+        self.auth_client.cookies[STICKY_COOKIE] = '1'
+        self.assertTrue(self.auth_client.get(self.profile_url)
+                        .has_header('ETag'))
+
+
+class TestBenchmarkCommands(TestCase):
+    def test_seed_and_bench_views(self):
+        call_command('seed', users=5, groups=2, posts=40, comments=30,
+                     follows=2, stdout=StringIO())
+        self.assertEqual(User.objects.count(), 5)
+        self.assertEqual(Post.objects.count(), 40)
+        self.assertEqual(UserStats.objects.get(
+            user=Post.objects.first().author).posts_count,
+            Post.objects.filter(author=Post.objects.first().author).count())
+        with tempfile.NamedTemporaryFile(suffix='.json') as output:
+            call_command('bench_views', repeat=2, output=output.name,
+                         stdout=StringIO())
+            results = json.load(output)
+        self.assertEqual(results['index']['status'], 200)
+        self.assertGreater(results['index']['bytes'], 0)
+        self.assertLessEqual(results['index']['p50'],
+                             results['index']['p99'])
+        self.assertIn('follow_index', results)
+
+
+class TestMetrics(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        Post.objects.create(text='Measured', author=self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'metrics.sqlite3')
+        self.settings_override = override_settings(METRICS_PATH=path)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def value(self, text, series):
+        match = re.search(re.escape(series) + r' (\S+)', text)
+        return float(match.group(1)) if match else 0
+
+    @override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+    def test_metrics_per_view(self):
+        self.client_logout.get(reverse('index'))
+        self.client_logout.get(reverse('index'))
+        text = self.client_logout.get('/metrics').content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      text)
+        self.assertGreaterEqual(self.value(
+            text, 'yatube_request_duration_seconds_count{view="index"}'), 2)
+        self.assertGreater(self.value(
+            text, 'yatube_db_queries_sum{view="index"}'), 0)
+        self.assertGreater(self.value(
+            text, 'yatube_template_duration_seconds_sum{view="index"}'), 0)
+        self.assertGreaterEqual(self.value(
+            text, 'yatube_cache_requests_total{view="index",outcome="hit"}'),
+            1)
+
+    def test_metrics_hidden_by_default(self):
+        self.assertEqual(self.client_logout.get('/metrics').status_code, 404)
+        self.assertEqual(self.auth_client.get('/metrics').status_code, 404)
+        self.user.is_staff = True
+        self.user.save()
+        self.assertEqual(self.auth_client.get('/metrics').status_code, 200)
+
+    def test_flushes_add_up(self):
+        series = 'yatube_db_queries_count{view="test"}'
+        for _ in range(2):
+            metrics.observe('yatube_db_queries', 3, view='test')
+            metrics.flush()
+        self.assertEqual(self.value(metrics.render(), series), 2)
+
+
+class TestProfiling(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        Post.objects.create(text='Profiled', author=self.user)
+        self.url = reverse('profile', args=[self.user.username])
+
+    def test_staff_can_profile_request(self):
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.auth_client.get(self.url, {'profile': 1})
+        self.assertContains(response, 'Profiled')
+        profile = RequestProfile.objects.get()
+        self.assertEqual(profile.view_name, 'profile')
+        self.assertIn('function calls', profile.stats)
+        admin_page = self.auth_client.get(response['X-Profile'])
+        self.assertContains(admin_page, 'function calls')
+
+    def test_flag_ignored_for_others(self):
+        self.auth_client.get(self.url, {'profile': 1})
+        self.client_logout.get(self.url, HTTP_X_PROFILE='1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_slow_queries_logged_with_plan(self):
+        self.client_logout.get(self.url)
+        query = SlowQuery.objects.filter(sql__contains='posts_post').first()
+        self.assertEqual(query.view_name, 'profile')
+        self.assertIn('posts_post', query.plan)
+
+    def test_nothing_logged_by_default(self):
+        self.client_logout.get(self.url)
+        self.assertFalse(SlowQuery.objects.exists())
+
+
+class TestWindowPagination(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        Post.objects.bulk_create(
+            [Post(text=f'Post {i}', author=self.user) for i in range(150)])
+
+    def page_links(self, response):
+        return re.findall(r'page=(\d+)">\d+<', response.content.decode())
+
+    @override_settings(PAGINATION_WINDOW=3)
+    def test_window_around_current_page(self):
+        self.assertEqual(page_window(Paginator(range(1000), 10).page(50)),
+                         [1, None, 47, 48, 49, 50, 51, 52, 53, None, 100])
+        self.assertEqual(page_window(Paginator(range(30), 10).page(1)),
+                         [1, 2, 3])
+        response = self.client_logout.get(reverse('index'), {'page': 8})
+        self.assertEqual(self.page_links(response),
+                         ['1', '5', '6', '7', '9', '10', '11', '15'])
+
+    @override_settings(UNCOUNTED_PAGINATION_VIEWS={'index'})
+    def test_uncounted_pages(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_logout.get(reverse('index'), {'page': 2})
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in queries.captured_queries))
+        page = response.context['page']
+        self.assertEqual(page.start_index(), 11)
+        self.assertEqual(len(page), 10)
+        self.assertTrue(page.has_next())
+        self.assertEqual(self.page_links(response), ['1', '3'])
+        response = self.client_logout.get(reverse('index'), {'page': 15})
+        self.assertFalse(response.context['page'].has_next())
+        response = self.client_logout.get(reverse('index'), {'page': 16})
+        self.assertEqual(response.context['page'].number, 1)
+
+
+class TestPostText(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        lines = [f'Line {i} <b>' for i in range(20)]
+        self.post = Post.objects.create(text='\n'.join(lines),
+                                        author=self.user, group=self.group)
+
+    @override_settings(POST_PREVIEW_LINES=3)
+    def test_lists_show_escaped_preview(self):
+        self.post.save()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client_logout.get(
+                reverse('group_posts', args=[self.group.slug]))
+        self.assertContains(response, 'Line 2 &lt;b&gt;')
+        self.assertNotContains(response, 'Line 3 ')
+        self.assertContains(response, 'Читать дальше')
+        self.assertFalse(any('"posts_post"."text"' in query['sql']
+                             for query in queries.captured_queries))
+
+        response = self.client_logout.get(
+            reverse('post_detail', args=[self.user.username, self.post.id]))
+        self.assertContains(response, 'Line 18 &lt;b&gt;<br>')
+        self.assertNotContains(response, 'Читать дальше')
+
+    def test_html_follows_edits(self):
+        self.auth_client.post(
+            reverse('post_edit', args=[self.user.username, self.post.id]),
+            data={'text': 'Short\nedit', 'group': self.group.id})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text_html, 'Short<br>edit')
+        self.assertEqual(self.post.preview_html, 'Short<br>edit')
+        self.assertFalse(self.post.text_truncated)
+
+
+class TestLookupCache(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.post = Post.objects.create(text='Text', author=self.user,
+                                        group=self.group)
+        self.url = reverse('post_detail',
+                           args=[self.user.username, self.post.id])
+
+    def test_repeated_lookup_skips_query(self):
+        self.client_logout.get(self.url)
+        lookups.clear()
+        with CaptureQueriesContext(connection) as first:
+            self.client_logout.get(self.url)
+        with CaptureQueriesContext(connection) as second:
+            response = self.client_logout.get(self.url)
+        self.assertEqual(len(second), len(first) - 1)
+        self.assertEqual(response.context['author'], self.user)
+        self.assertEqual(lookups.lookup_stats()['user']['hits'], 1)
+
+    def test_rename_and_delete_invalidate(self):
+        group_url = reverse('group_posts', args=[self.group.slug])
+        self.client_logout.get(self.url)
+        self.client_logout.get(group_url)
+        self.user.username = 'Fred'
+        self.user.save()
+        self.assertEqual(self.client_logout.get(self.url).status_code, 404)
+        response = self.client_logout.get(
+            reverse('post_detail', args=['Fred', self.post.id]))
+        self.assertEqual(response.status_code, 200)
+        self.group.delete()
+        self.assertEqual(self.client_logout.get(group_url).status_code, 404)
+
+    def test_bounded_lru(self):
+        cache = lookups.LRUCache(size=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual((cache.get('a'), cache.get('c')), (1, 3))
+
+
+class TestPostCards(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.post = Post.objects.create(text='Card', author=self.user,
+                                        group=self.group)
+        self.edit_url = reverse('post_edit',
+                                args=[self.user.username, self.post.id])
+
+    def test_cards_shared_and_edit_link_per_viewer(self):
+        with mock.patch('posts.fragments.render_to_string',
+                        wraps=fragments.render_to_string) as render:
+            author_page = self.auth_client.get(reverse('index'))
+            other_page = self.client_logout.get(
+                reverse('group_posts', args=[self.group.slug]))
+        cards = [call for call in render.call_args_list
+                 if call[0][0] == 'posts/includes/post_item.html']
+        self.assertEqual(len(cards), 1)
+        self.assertContains(author_page, self.edit_url)
+        self.assertContains(other_page, 'Card')
+        self.assertNotContains(other_page, self.edit_url)
+
+    def test_key_follows_shown_data(self):
+        key = fragments.card_key(self.post, True)
+        Post.objects.filter(pk=self.post.pk).update(
+            thumbnail='/media/thumb.jpg', comment_count=2)
+        self.post.refresh_from_db()
+        self.assertNotEqual(fragments.card_key(self.post, True), key)
+        response = self.client_logout.get(reverse('index'))
+        self.assertContains(response, '/media/thumb.jpg')
+        self.assertContains(response, 'Комментариев: 2')
+
+
+class TestConditionalGet(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.author = User.objects.create_user(username='Lola')
+        self.post = Post.objects.create(text='Text', author=self.author,
+                                        group=self.group)
+
+    def revalidate(self, client, url):
+        # Первый ответ ставит cookie CSRF, от которой зависит ETag.
+        client.get(url)
+        etag = client.get(url)['ETag']
+        return client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_pages_return_304(self):
+        urls = (
+            reverse('index'),
+            reverse('group_posts', args=[self.group.slug]),
+            reverse('profile', args=[self.author.username]),
+            reverse('post_detail', args=[self.author.username,
+                                         self.post.id]),
+            reverse('follow_index'),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.revalidate(self.auth_client, url)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+                self.assertFalse(response.templates)
+
+    def test_etag_follows_data_and_viewer(self):
+        url = reverse('post_detail', args=[self.author.username,
+                                           self.post.id])
+        etag = self.client_logout.get(url)['ETag']
+        self.assertNotEqual(self.auth_client.get(url)['ETag'], etag)
+        self.auth_client.post(
+            reverse('add_comment', args=[self.author.username, self.post.id]),
+            data={'text': 'New comment'})
+        response = self.client_logout.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'New comment')
+
+        feed = reverse('follow_index')
+        etag = self.auth_client.get(feed)['ETag']
+        self.auth_client.get(
+            reverse('profile_follow', args=[self.author.username]))
+        response = self.auth_client.get(feed, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Text')
+
+    def test_stale_page_gets_no_etag(self):
+        url = reverse('index')
+        request = self.client_logout.get(url).wsgi_request
+        Post.objects.create(text='Fresh', author=self.author)
+        # Пересчёт страницы держит другой запрос.
+        cache.add(feed_cache_key(request, 'index') + ':lock', 1)
+        response = self.client_logout.get(url)
+        self.assertNotContains(response, 'Fresh')
+        self.assertFalse(response.has_header('ETag'))
+
+    def test_new_csrf_secret_changes_etag(self):
+        url = reverse('post_detail', args=[self.author.username,
+                                           self.post.id])
+        etag = self.auth_client.get(url)['ETag']
+        self.auth_client.cookies['csrftoken'] = 'b' * 64
+        response = self.auth_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestCacheControl(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.post = Post.objects.create(text='Text', author=self.user,
+                                        group=self.group)
+
+    def test_policy_by_viewer_and_view(self):
+        for url in (reverse('index'),
+                    reverse('post_detail', args=[self.user.username,
+                                                 self.post.id])):
+            with self.subTest(url=url):
+                response = self.client_logout.get(url)
+                self.assertIn('public', response['Cache-Control'])
+                self.assertIn('s-maxage=60', response['Cache-Control'])
+                self.assertIn('Cookie', response['Vary'])
+                response = self.auth_client.get(url)
+                self.assertIn('private', response['Cache-Control'])
+        response = self.client_logout.get(reverse('search'))
+        self.assertFalse(response.has_header('Cache-Control'))
+
+    def purged(self, change):
+        with mock.patch('yatube.cache_control.transaction.on_commit',
+                        side_effect=lambda callback: callback()), \
+                mock.patch('yatube.cache_control._send') as send, \
+                mock.patch('yatube.cache_control._submit', send):
+            change()
+        return [path for call in send.call_args_list for path in call[0][0]]
+
+    @override_settings(CACHE_PURGE_URL='http://127.0.0.1:6081')
+    def test_post_changes_purge_pages(self):
+        self.post.text = 'Edited'
+        self.assertEqual(self.purged(self.post.save), [
+            '/', f'/{self.user.username}/', f'/group/{self.group.slug}/',
+            f'/{self.user.username}/{self.post.id}/'])
+
+    @override_settings(CACHE_PURGE_URL='http://127.0.0.1:6081')
+    def test_purge_sent_outside_request_thread(self):
+        with mock.patch('yatube.cache_control.transaction.on_commit',
+                        side_effect=lambda callback: callback()), \
+                mock.patch('yatube.cache_control._send') as send, \
+                mock.patch('yatube.cache_control._get_executor') as executor:
+            self.post.save()
+        send.assert_not_called()
+        executor.return_value.submit.assert_called()
+
+    @override_settings(CACHE_PURGE_URL='http://127.0.0.1:6081')
+    def test_follow_and_rename_purge_pages(self):
+        reader = User.objects.create_user(username='Reader')
+        paths = self.purged(
+            lambda: Follow.objects.create(user=reader, author=self.user))
+        self.assertIn(f'/{self.user.username}/', paths)
+        self.assertIn(f'/{self.user.username}/{self.post.id}/', paths)
+        self.assertIn('/Reader/', paths)
+        old_name = self.user.username
+        self.user.username = 'Fred'
+        paths = self.purged(self.user.save)
+        for path in ('/', f'/{old_name}/', f'/group/{self.group.slug}/',
+                     f'/{old_name}/{self.post.id}/'):
+            self.assertIn(path, paths)
+
+
+class TestSnapshots(TransactionTestCase):
+    """Снимки пишутся после коммита, поэтому без TestCase."""
+
+    def setUp(self):
+        cache.clear()
+        lookups.clear()
+        self.root = tempfile.mkdtemp()
+        self.settings = override_settings(SNAPSHOT_ROOT=self.root)
+        self.settings.enable()
+        # Пересоздаём снимки сразу, а не в фоновом потоке.
+        self.submit = mock.patch.object(snapshots, '_submit', snapshots._run)
+        self.submit.start()
+        self.client_logout = Client()
+        self.auth_client = Client()
+        self.user = User.objects.create_user(username='Barney')
+        self.auth_client.force_login(self.user)
+        self.group = Group.objects.create(title='Группа', slug='testgroup')
+        self.other = Group.objects.create(title='Другая', slug='other')
+        self.post = Post.objects.create(text='Snapshot', author=self.user,
+                                        group=self.group)
+
+    def tearDown(self):
+        self.submit.stop()
+        self.settings.disable()
+        shutil.rmtree(self.root)
+
+    def test_anonymous_pages_served_from_snapshots(self):
+        for url in (reverse('index'),
+                    reverse('group_posts', args=[self.group.slug]),
+                    reverse('profile', args=[self.user.username])):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client_logout.get(url)
+                self.assertEqual(response['X-Snapshot'], '1')
+                self.assertContains(response, 'Snapshot')
+                self.assertEqual(len(queries), 0)
+        response = self.auth_client.get(reverse('index'))
+        self.assertFalse(response.has_header('X-Snapshot'))
+        response = self.client_logout.get(reverse('index') + '?page=2')
+        self.assertFalse(response.has_header('X-Snapshot'))
+
+    def test_profile_snapshot_sees_new_post_count(self):
+        self.auth_client.post(reverse('new_post'), data={'text': 'Second'})
+        response = self.client_logout.get(
+            reverse('profile', args=[self.user.username]))
+        self.assertEqual(response['X-Snapshot'], '1')
+        self.assertContains(response, 'Second')
+        self.assertRegex(response.content.decode(), r'Записей:\s+2\s')
+
+    def test_snapshots_follow_post_edits(self):
+        self.post.text = 'Edited'
+        self.post.group = self.other
+        self.post.save()
+        index = self.client_logout.get(reverse('index'))
+        self.assertContains(index, 'Edited')
+        old_group = self.client_logout.get(
+            reverse('group_posts', args=[self.group.slug]))
+        self.assertEqual(old_group['X-Snapshot'], '1')
+        self.assertNotContains(old_group, 'Edited')
+
+    def test_comments_and_follows_update_snapshots(self):
+        reader = User.objects.create_user(username='Reader')
+        Comment.objects.create(post=self.post, author=reader, text='Hi')
+        Follow.objects.create(user=reader, author=self.user)
+        index = self.client_logout.get(reverse('index'))
+        self.assertEqual(index['X-Snapshot'], '1')
+        self.assertContains(index, 'Комментариев: 1')
+        profile = self.client_logout.get(
+            reverse('profile', args=[self.user.username]))
+        self.assertEqual(profile['X-Snapshot'], '1')
+        self.assertRegex(profile.content.decode(), r'Подписчиков:\s+1\s')
+
+    def test_renamed_user_snapshot_removed(self):
+        old_profile = reverse('profile', args=[self.user.username])
+        self.user.username = 'Fred'
+        self.user.save()
+        self.assertFalse(os.path.exists(snapshots.snapshot_file(old_profile)))
+        self.assertFalse(os.path.exists(os.path.join(self.root, 'Barney')))
+        self.assertEqual(self.client_logout.get(old_profile).status_code, 404)
+        index = self.client_logout.get(reverse('index'))
+        self.assertEqual(index['X-Snapshot'], '1')
+        self.assertContains(index, 'Fred')
+        new_profile = self.client_logout.get(reverse('profile', args=['Fred']))
+        self.assertEqual(new_profile['X-Snapshot'], '1')
+
+    def test_build_snapshots_prunes_stale_files(self):
+        stale = snapshots.snapshot_file('/Gone/')
+        os.makedirs(os.path.dirname(stale))
+        with open(stale, 'w') as handle:
+            handle.write('stale')
+        call_command('build_snapshots', stdout=StringIO())
+        self.assertFalse(os.path.exists(stale))
+        self.assertTrue(os.path.exists(snapshots.snapshot_file('/')))
+
+
+class TestCursorPagination(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        for i in range(15):
+            Post.objects.create(text=f'Post {i}', author=self.user,
+                                group=self.group)
+        self.url = reverse('group_posts', args=[self.group.slug])
+
+    @override_settings(CURSOR_PAGINATION_VIEWS={'group_posts'})
+    def test_cursor_pages(self):
+        response = self.client_logout.get(self.url)
+        first = response.context['page']
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+
+        response = self.client_logout.get(
+            self.url, {'after': first.next_cursor()})
+        second = response.context['page']
+        self.assertEqual([post.text for post in second],
+                         [f'Post {i}' for i in range(4, -1, -1)])
+        self.assertFalse(second.has_next())
+
+        response = self.client_logout.get(
+            self.url, {'before': second.previous_cursor()})
+        self.assertEqual(list(response.context['page']), list(first))
+
+    @override_settings(CURSOR_PAGINATION_VIEWS={'group_posts'})
+    def test_page_number_compatibility(self):
+        response = self.client_logout.get(self.url, {'page': 2})
+        self.assertEqual(response.context['page'].number, 2)
+        self.assertEqual(len(response.context['page']), 5)
+
+
+class TestCounters(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.other_user = User.objects.create_user(username='Lola')
+        self.post = Post.objects.create(text='Counted', author=self.other_user)
+
+    def test_counters_follow_writes(self):
+        self.auth_client.post(
+            reverse('add_comment', args=[self.other_user.username,
+                                         self.post.id]),
+            data={'text': 'comment'})
+        self.auth_client.get(
+            reverse('profile_follow', args=[self.other_user.username]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+        stats = UserStats.objects.get(user=self.other_user)
+        self.assertEqual(
+            (stats.posts_count, stats.followers_count, stats.following_count),
+            (1, 1, 0))
+        self.assertEqual(
+            UserStats.objects.get(user=self.user).following_count, 1)
+
+        self.auth_client.get(
+            reverse('profile_unfollow', args=[self.other_user.username]))
+        stats.refresh_from_db()
+        self.assertEqual(stats.followers_count, 0)
+
+    def test_post_edit_keeps_concurrent_writes(self):
+        self.auth_client.force_login(self.other_user)
+        clean_image = PostForm.clean_image
+
+        def concurrent(form):
+            # Комментарий и миниатюра появляются, пока идёт правка.
+            Post.objects.filter(pk=self.post.pk).update(
+                comment_count=1, thumbnail='thumbnail.jpg')
+            return clean_image(form)
+
+        with mock.patch.object(PostForm, 'clean_image', concurrent):
+            self.auth_client.post(
+                reverse('post_edit', args=[self.other_user.username,
+                                           self.post.id]),
+                data={'text': 'Edited'})
+        self.post.refresh_from_db()
+        self.assertEqual(
+            (self.post.text, self.post.comment_count, self.post.thumbnail),
+            ('Edited', 1, 'thumbnail.jpg'))
+
+    def test_reconcile_counters(self):
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        UserStats.objects.filter(user=self.other_user).delete()
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.other_user).posts_count, 1)
+
+
+class TestQueryBudget(QueryBudgetMixin, DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.other_user = User.objects.create_user(username='Lola')
+        Follow.objects.create(user=self.user, author=self.other_user)
+        self.post = self.create_posts(1)
+
+    def create_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(text=f'Budget {i}',
+                                       author=self.other_user,
+                                       group=self.group)
+            post.comments.create(author=self.user, text='comment')
+            if hasattr(self, 'post'):
+                self.post.comments.create(author=self.other_user,
+                                          text='comment')
+        return post
+
+    def urls(self):
+        return (
+            reverse('index'),
+            reverse('group_posts', args=[self.group.slug]),
+            reverse('profile', args=[self.other_user.username]),
+            reverse('post_detail', args=[self.other_user.username,
+                                         self.post.id]),
+            reverse('follow_index'),
+        )
+
+    def test_queries_do_not_grow_with_page_size(self):
+        for url in self.urls():
+            with self.subTest(url=url):
+                cache.clear()
+                lookups.clear()
+                small = self.assertQueryBudget(self.auth_client, url)
+                self.create_posts(9)
+                cache.clear()
+                lookups.clear()
+                full = self.assertQueryBudget(self.auth_client, url)
+                self.assertEqual(small, full)
+
+
+class TestIndexCache(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        for i in range(11):
+            Post.objects.create(text=f'Cached {i}', author=self.user)
+
+    def test_pages_are_cached_separately(self):
+        self.client_logout.get(reverse('index'))
+        response = self.client_logout.get(reverse('index'), {'page': 2})
+        self.assertContains(response, 'Cached 0')
+        self.assertNotContains(response, 'Cached 10')
+
+    def test_new_post_invalidates_cache(self):
+        self.client_logout.get(reverse('index'))
+        with self.assertNumQueries(0):
+            self.client_logout.get(reverse('index'))
+        Post.objects.create(text='Fresh post', author=self.user)
+        response = self.client_logout.get(reverse('index'))
+        self.assertContains(response, 'Fresh post')
+
+    def test_stale_copy_while_rebuilding(self):
+        response = self.client_logout.get(reverse('index'))
+        Post.objects.create(text='Fresh post', author=self.user)
+        key = feed_cache_key(response.wsgi_request, 'index')
+        cache.add(f'{key}:lock', 1)
+        stale = cache_stats().get('stale', 0)
+        response = self.client_logout.get(reverse('index'))
+        self.assertNotContains(response, 'Fresh post')
+        self.assertEqual(cache_stats()['stale'], stale + 1)
+        cache.delete(f'{key}:lock')
+        response = self.client_logout.get(reverse('index'))
+        self.assertContains(response, 'Fresh post')
+
+    def test_viewers_do_not_share_pages(self):
+        self.auth_client.get(reverse('index'))
+        response = self.client_logout.get(reverse('index'))
+        self.assertNotContains(response, 'Редактировать')
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        from yatube.cache import SQLiteCache
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(
+            os.path.join(directory.name, 'cache.sqlite3'),
+            {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_FREQUENCY': 2}})
+
+    def test_cache_api(self):
+        self.assertTrue(self.cache.add('key', 1))
+        self.assertFalse(self.cache.add('key', 2))
+        self.assertEqual(self.cache.incr('key', 5), 6)
+        self.assertRaises(ValueError, self.cache.incr, 'missing')
+        self.cache.set_many({'a': [1], 'b': {'c': 2}})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'missing']),
+                         {'a': [1], 'b': {'c': 2}})
+        self.cache.set('short', 1, timeout=0)
+        self.assertIsNone(self.cache.get('short'))
+        self.assertTrue(self.cache.add('short', 2))
+        self.assertTrue(self.cache.touch('short', timeout=None))
+        self.assertFalse(self.cache.touch('missing'))
+        self.cache.delete_many(['a', 'b'])
+        self.assertFalse(self.cache.has_key('a'))
+        self.cache.clear()
+        self.assertIsNone(self.cache.get('key'))
+
+    @mock.patch('yatube.cache.ACCESS_RESOLUTION', -1)
+    def test_cull_evicts_least_recently_used(self):
+        self.cache.set('kept', 1)
+        for i in range(99):
+            self.cache.set(f'key{i}', i)
+            self.cache.get('kept')
+        self.cache.set('last', 1)
+        self.assertEqual(self.cache.get('kept'), 1)
+        self.assertIsNone(self.cache.get('key0'))
+
+    def test_suite_does_not_touch_shared_files(self):
+        from django.conf import settings
+        for path in (settings.CACHES['default']['LOCATION'],
+                     settings.METRICS_PATH, settings.MEDIA_ROOT):
+            self.assertFalse(path.startswith(settings.BASE_DIR + os.sep))
+
+
+def make_image(name='image.png', size=(1200, 800), image_format='PNG',
+               **params):
+    buffer = BytesIO()
+    Image.new('RGB', size, color=(200, 30, 30)).save(
+        buffer, image_format, **params)
+    return SimpleUploadedFile(name, buffer.getvalue())
+
+
+class MediaSetUp(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class TestThumbnails(MediaSetUp):
+    @mock.patch('posts.thumbnails.get_thumbnail')
+    def test_no_image_processing_on_request(self, get_thumbnail):
+        self.auth_client.post(reverse('new_post'),
+                              data={'text': 'With image',
+                                    'image': make_image()})
+        post = Post.objects.get(text='With image')
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, post.image.url)
+        get_thumbnail.assert_not_called()
+
+    def test_generate_thumbnail(self):
+        post = Post.objects.create(text='With image', author=self.user,
+                                   image=make_image())
+        thumbnails.generate(post.pk)
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail)
+        response = self.auth_client.get(reverse('index'))
+        self.assertContains(response, post.thumbnail)
+
+    @override_settings(THUMBNAIL_MAX_ATTEMPTS=2)
+    @mock.patch('posts.thumbnails.get_thumbnail',
+                side_effect=OSError('truncated'))
+    def test_failing_thumbnail_is_skipped(self, get_thumbnail):
+        post = Post.objects.create(text='Broken', author=self.user,
+                                   image=make_image())
+        with self.assertLogs('posts.thumbnails', 'ERROR'):
+            for _ in range(3):
+                call_command('generate_thumbnails')
+        self.assertEqual(get_thumbnail.call_count, 2)
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail_attempts, 2)
+
+
+class TestImageIngestion(MediaSetUp):
+    def test_downsample_and_strip_exif(self):
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera'
+        upload = make_image('photo.jpg', size=(5120, 1000),
+                            image_format='JPEG', exif=exif.tobytes())
+        self.auth_client.post(reverse('new_post'),
+                              data={'text': 'Big photo', 'image': upload})
+        post = Post.objects.get(text='Big photo')
+        self.assertEqual((post.image_width, post.image_height,
+                          post.image_format), (2560, 500, 'JPEG'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (2560, 500))
+            self.assertFalse(image.getexif())
+
+    @override_settings(POST_IMAGE_MAX_PIXELS=100)
+    def test_reject_huge_dimensions(self):
+        response = self.auth_client.post(
+            reverse('new_post'),
+            data={'text': 'Huge', 'image': make_image(size=(20, 20))})
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(response.context['form'].errors['image'])
+
+    def test_cmyk_tiff_converted(self):
+        buffer = BytesIO()
+        Image.new('CMYK', (40, 20)).save(buffer, 'TIFF')
+        upload = SimpleUploadedFile('scan.tiff', buffer.getvalue())
+        self.auth_client.post(reverse('new_post'),
+                              data={'text': 'Scan', 'image': upload})
+        post = Post.objects.get(text='Scan')
+        self.assertEqual(post.image_format, 'PNG')
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.mode, 'RGB')
+
+    def test_undecodable_image_is_form_error(self):
+        with mock.patch('posts.images.ImageOps.exif_transpose',
+                        side_effect=OSError('broken data stream')):
+            response = self.auth_client.post(
+                reverse('new_post'),
+                data={'text': 'Broken', 'image': make_image()})
+        self.assertFalse(Post.objects.exists())
+        self.assertTrue(response.context['form'].errors['image'])
+
+
+class TestSearch(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.once = Post.objects.create(
+            text='Кот сидел на окне и смотрел на улицу', author=self.user)
+        self.twice = Post.objects.create(
+            text='Кот и ещё раз кот', author=self.user)
+        Post.objects.create(text='Собака лаяла', author=self.user)
+
+    def test_ranked_results(self):
+        self.assertEqual(list(search_posts('кот')), [self.twice, self.once])
+        self.assertEqual(list(search_posts('кот окне')), [self.once])
+        self.assertFalse(search_posts('"OR AND*'))
+
+    def test_index_follows_updates(self):
+        self.once.text = 'Теперь про хомяка'
+        self.once.save()
+        self.assertEqual(list(search_posts('кот')), [self.twice])
+        self.twice.delete()
+        self.assertFalse(search_posts('кот').exists())
+        self.assertEqual(list(search_posts('хомяка')), [self.once])
+
+    @override_settings(SEARCH_MAX_RESULTS=1)
+    def test_admin_search_is_not_capped(self):
+        self.assertEqual(list(search_posts('кот')), [self.twice])
+        # Более релевантный пост старше: порядок по дате был бы обратным.
+        Post.objects.filter(pk=self.twice.pk).update(
+            pub_date=self.once.pub_date - dt.timedelta(days=1))
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        response = self.auth_client.get(
+            reverse('admin:posts_post_changelist'), {'q': 'кот'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.twice, self.once])
+
+    def test_search_page(self):
+        response = self.client_logout.get(reverse('search'), {'q': 'собака'})
+        self.assertEqual(len(response.context['page']), 1)
+        self.assertContains(response, 'Собака лаяла')
+
+
+class TestComments(DefaultSetUp):
+    def setUp(self):
+        self.defaultSetUp()
+        self.post = Post.objects.create(text='Viral', author=self.user)
+        for i in range(25):
+            self.post.comments.create(author=self.user, text=f'Comment {i}')
+        self.url = reverse('post_detail',
+                           args=[self.user.username, self.post.id])
+
+    def test_comment_pages(self):
+        response = self.client_logout.get(self.url)
+        self.assertContains(response, 'Comment 24')
+        self.assertContains(response, 'Comment 5<')
+        self.assertNotContains(response, 'Comment 4<')
+        more = re.search(r'href="([^"]+/comments/\?after=[^"]+)"',
+                         response.content.decode()).group(1)
+        response = self.client_logout.get(more.replace('&amp;', '&'))
+        self.assertContains(response, 'Comment 4<')
+        self.assertContains(response, 'Comment 0<')
+        self.assertNotContains(response, 'Comment 5<')
+        self.assertNotContains(response, 'js-more-comments')
+
+    def test_first_page_cached_until_new_comment(self):
+        self.client_logout.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            self.client_logout.get(self.url)
+        self.assertFalse(any('posts_comment' in query['sql']
+                             for query in queries.captured_queries))
+        self.auth_client.post(
+            reverse('add_comment', args=[self.user.username, self.post.id]),
+            data={'text': 'Newest comment'})
+        response = self.client_logout.get(self.url)
+        self.assertContains(response, 'Newest comment')
+
+    def test_replaced_comment_and_rename_refresh_page(self):
+        self.client_logout.get(self.url)
+        self.post.comments.get(text='Comment 24').delete()
+        self.post.comments.create(author=self.user, text='Replacement')
+        response = self.client_logout.get(self.url)
+        self.assertContains(response, 'Replacement')
+        self.assertNotContains(response, 'Comment 24')
+
+        commenter = User.objects.create_user(username='Lola')
+        self.post.comments.create(author=commenter, text='By Lola')
+        self.client_logout.get(self.url)
+        commenter.username = 'Renamed'
+        commenter.save()
+        self.assertContains(self.client_logout.get(self.url), 'Renamed')
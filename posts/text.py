@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.template.defaultfilters import linebreaksbr
+from django.utils.text import Truncator
+
+
+def render_text(text):
+    """Готовит HTML текста поста и превью для лент.
+
+    Превью — первые POST_PREVIEW_LINES строк, но не больше
+    POST_PREVIEW_CHARS символов. Возвращает (html, html превью, обрезан ли
+    текст в превью).
+    """
+    html = str(linebreaksbr(text))
+    lines = text.splitlines()
+    preview = "\n".join(lines[:settings.POST_PREVIEW_LINES])
+    truncated = (len(lines) > settings.POST_PREVIEW_LINES
+                 or len(preview) > settings.POST_PREVIEW_CHARS)
+    if not truncated:
+        return html, html, False
+    preview = Truncator(preview).chars(settings.POST_PREVIEW_CHARS)
+    return html, str(linebreaksbr(preview)), True
@@ -0,0 +1,62 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from sorl.thumbnail import get_thumbnail
+
+from . import snapshots
+from .caching import bump_generation
+from .models import Post
+
+GEOMETRY = "960x339"
+OPTIONS = {"crop": "center", "upscale": True}
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix="thumbnails")
+    return _executor
+
+
+def generate(post_id):
+    post = Post.objects.filter(pk=post_id).only("image").first()
+    if post is None or not post.image:
+        return
+    thumbnail = get_thumbnail(post.image, GEOMETRY, **OPTIONS)
+    updated = Post.objects.filter(pk=post_id, image=post.image.name).update(
+        thumbnail=thumbnail.url)
+    if updated:
+        bump_generation()
+        snapshots.schedule_post(post_id)
+
+
+def _run(post_id):
+    try:
+        generate(post_id)
+    except Exception:
+        logger.exception("Не удалось создать миниатюру поста %s", post_id)
+        # После THUMBNAIL_MAX_ATTEMPTS неудач пост больше не берётся в
+        # работу, пока не загрузят другую картинку.
+        Post.objects.filter(pk=post_id).update(
+            thumbnail_attempts=F("thumbnail_attempts") + 1)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Ставит миниатюру поста в очередь потоков после коммита транзакции.
+
+    При THUMBNAIL_WORKERS = 0 очередь не используется, миниатюры создаёт
+    отдельный процесс manage.py generate_thumbnails --loop.
+    """
+    if not post.image or post.thumbnail or not settings.THUMBNAIL_WORKERS:
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_run, post.pk))
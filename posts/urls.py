@@ -6,6 +6,7 @@ urlpatterns = [
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
     path("new/", views.new_post, name="new_post"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("search/", views.search, name="search"),
     path("<str:username>/follow/", views.profile_follow,
          name="profile_follow"),
     path("<str:username>/unfollow/", views.profile_unfollow,
@@ -16,6 +17,8 @@ urlpatterns = [
          name="post_edit"),
     path("<str:username>/<int:post_id>/comment/", views.add_comment,
          name="add_comment"),
+    path("<str:username>/<int:post_id>/comments/", views.post_comments,
+         name="post_comments"),
     path("404/", views.page_not_found, name="not_found"),
     path("500/", views.server_error, name="server_error")
 ]
@@ -1,32 +1,54 @@
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.core.paginator import Paginator
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.cache import cache_page
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
+from . import thumbnails
+from .caching import generation, get_or_rebuild
+from .decorators import cache_feed, conditional_page, query_budget
+from .feed import FollowFeed
 from .forms import PostForm, CommentForm
-from .models import Group, Post, User, Follow
+from .lookups import get_group_or_404, get_user_or_404
+from .models import LIST_DEFERRED, Post, User, Follow
+from .paginator import CursorPaginator, decode_cursor, paginate
+from .search import search_posts
 
 
-@cache_page(20)
+@query_budget(4)
+@conditional_page
+@cache_feed()
 def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.select_related("author", "group").defer(
+        *LIST_DEFERRED)
+    paginator, page = paginate(request, post_list)
     context = {"page": page, "paginator": paginator}
     return render(request, "index.html", context)
 
 
+@query_budget(5)
+@conditional_page
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    group = get_group_or_404(slug)
+    post_list = group.posts.select_related("author", "group").defer(
+        *LIST_DEFERRED)
+    paginator, page = paginate(request, post_list)
     context = {"group": group, "page": page, "paginator": paginator}
     return render(request, "posts/group.html", context)
 
 
+def search(request):
+    query = request.GET.get("q", "").strip()
+    post_list = search_posts(query).select_related(
+        "author", "group").defer(*LIST_DEFERRED)
+    paginator = Paginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "search.html",
+                  {"page": page, "paginator": paginator, "query": query})
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -34,51 +56,95 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect("index")
     return render(request, "posts/new_post.html", {"form": form})
 
 
+@query_budget(6)
+@conditional_page
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get("page")
-    page = paginator.get_page(page_number)
+    # Счётчики в карточке автора нужны свежие, поэтому пользователь
+    # загружается вместе с ними одним запросом, мимо кеша поиска.
+    author = get_object_or_404(
+        User.objects.select_related("stats"), username=username)
+    post_list = author.posts.select_related("author", "group").defer(
+        *LIST_DEFERRED)
+    paginator, page = paginate(request, post_list)
     following = author.following.exists()
     return render(request, "profile.html",
                   {"page": page, "paginator": paginator,
                    "author": author, 'following': following})
 
 
+@query_budget(5)
+@conditional_page
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.posts.all(), pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related("author__stats", "group"), pk=post_id,
+        author=get_user_or_404(username))
+    author = post.author
     form = CommentForm()
+    # Шаблон выводит comments_html, а QuerySet комментариев остаётся в
+    # контексте для tests/test_post.py и не выполняется.
     comments = post.comments.all()
-    return render(request, "posts/post.html", {"post": post,
-                  "author": author, "form": form, "comments": comments})
+    # Поколение меняется при любом добавлении или удалении комментария и
+    # при переименовании пользователя, число комментариев — нет.
+    comments_html = get_or_rebuild(
+        f"comments:{post.pk}", lambda: render_comments(request, post),
+        settings.FEED_CACHE_TIMEOUT, version=generation())
+    return render(request, "posts/post.html", {
+        "post": post, "author": author, "form": form, "comments": comments,
+        "comments_html": mark_safe(comments_html)})
+
+
+def post_comments(request, username, post_id):
+    post = get_object_or_404(
+        Post.objects.select_related("author"), pk=post_id,
+        author__username=username)
+    after = decode_cursor(request.GET.get("after", ""))
+    return HttpResponse(render_comments(request, post, after))
+
+
+def render_comments(request, post, after=None):
+    paginator = CursorPaginator(
+        post.comments.select_related("author"),
+        settings.COMMENTS_PER_PAGE, fields=("created", "id"))
+    return render_to_string(
+        "posts/includes/comment_list.html",
+        {"post": post, "comment_page": paginator.page(after=after)}, request)
 
 
 def post_edit(request, username, post_id):
-    user = get_object_or_404(User, username=username)
+    user = get_user_or_404(username)
     if request.user != user:
         return redirect("post_detail", username=username,
                         post_id=post_id)
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    post = get_object_or_404(Post, pk=post_id, author=user)
     form = PostForm(request.POST or None, files=request.FILES or None,
                     instance=post)
     if form.is_valid():
-        form.save()
+        # Только поля формы и то, что из них вычисляется: счётчик
+        # комментариев и миниатюру тем временем могли изменить другие
+        # запросы и воркер.
+        fields = [*form.Meta.fields,
+                  "text_html", "preview_html", "text_truncated",
+                  "image_width", "image_height", "image_format"]
+        if "image" in form.changed_data:
+            post.thumbnail = ""
+            post.thumbnail_attempts = 0
+            fields += ["thumbnail", "thumbnail_attempts"]
+        form.save(commit=False).save(update_fields=fields)
+        thumbnails.schedule(post)
         return redirect("post_detail", username=username, post_id=post.pk)
     return render(request, "posts/new_post.html", {"form": form, "post": post})
 
 
 @login_required
 def add_comment(request, username, post_id):
-    post_author = get_object_or_404(User, username=username)
+    post_author = get_user_or_404(username)
     post = get_object_or_404(Post, id=post_id, author=post_author)
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
     if request.method == "POST" and form.is_valid():
         comment = form.save(commit=False)
         comment.post = post
@@ -100,12 +166,12 @@ def server_error(request):
     return render(request, "misc/500.html", status=500)
 
 
+@query_budget(6)
 @login_required
+@conditional_page
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    posts = FollowFeed(request.user)
+    paginator, page = paginate(request, posts)
     return render(
         request,
         'follow.html',
@@ -114,7 +180,7 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     user = request.user
     if author != user:
         Follow.objects.get_or_create(user=user, author=author)
@@ -123,7 +189,7 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_user_or_404(username)
     user = request.user
     if author != user:
         to_delete = get_object_or_404(Follow, user=user, author=author)
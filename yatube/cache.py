@@ -0,0 +1,213 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import count
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Как часто (раз в сколько записей) проверять размер кеша и время доступа,
+# которое не обновляется при чтении чаще раза в секунду: вытеснение
+# приблизительное, но чтения почти не пишут в файл.
+CULL_CHECK_INTERVAL = 100
+ACCESS_RESOLUTION = 1.0
+# SQLite ограничивает число параметров в одном запросе.
+MAX_PARAMS = 900
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite в режиме WAL.
+
+    Файл общий для всех процессов WSGI на одном хосте, поэтому записи и
+    их инвалидация видны всем воркерам без отдельного сервиса. При
+    превышении MAX_ENTRIES вытесняются давно не читавшиеся записи.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+        self._writes = count()
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None,
+                check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires REAL, accessed REAL NOT NULL) WITHOUT ROWID")
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS cache_accessed "
+                "ON cache (accessed)")
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dumps(self, value):
+        return sqlite3.Binary(pickle.dumps(value, self.pickle_protocol))
+
+    def _touch_accessed(self, connection, keys, now):
+        connection.executemany(
+            "UPDATE cache SET accessed = ? WHERE key = ?",
+            [(now, key) for key in keys])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        row = connection.execute(
+            "SELECT value, expires, accessed FROM cache WHERE key = ?",
+            (key,)).fetchone()
+        now = time.time()
+        if row is None or (row[1] is not None and row[1] <= now):
+            return default
+        if now - row[2] > ACCESS_RESOLUTION:
+            self._touch_accessed(connection, [key], now)
+        return pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        made = {self._key(key, version): key for key in keys}
+        connection = self._connection()
+        now = time.time()
+        found, stale = {}, []
+        made_keys = list(made)
+        for start in range(0, len(made_keys), MAX_PARAMS):
+            chunk = made_keys[start:start + MAX_PARAMS]
+            rows = connection.execute(
+                "SELECT key, value, expires, accessed FROM cache "
+                "WHERE key IN (%s)" % ", ".join("?" * len(chunk)), chunk)
+            for key, value, expires, accessed in rows:
+                if expires is not None and expires <= now:
+                    continue
+                found[made[key]] = pickle.loads(value)
+                if now - accessed > ACCESS_RESOLUTION:
+                    stale.append(key)
+        if stale:
+            self._touch_accessed(connection, stale, now)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self._key(key, version), self._dumps(value), expires, now)
+            for key, value in data.items()
+        ]
+        with self._transaction() as connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)", rows)
+        self._maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "INSERT INTO cache VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value, "
+                "expires = excluded.expires, accessed = excluded.accessed "
+                "WHERE cache.expires IS NOT NULL AND cache.expires <= ?",
+                (key, self._dumps(value), self.get_backend_timeout(timeout),
+                 now, now))
+            added = cursor.rowcount > 0
+        if added:
+            self._maybe_cull()
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "UPDATE cache SET expires = ?, accessed = ? WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (self.get_backend_timeout(timeout), now, key, now))
+        return cursor.rowcount > 0
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            row = connection.execute(
+                "SELECT value FROM cache WHERE key = ? "
+                "AND (expires IS NULL OR expires > ?)",
+                (key, now)).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                "UPDATE cache SET value = ?, accessed = ? WHERE key = ?",
+                (self._dumps(value), now, key))
+        return value
+
+    def has_key(self, key, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            "SELECT 1 FROM cache WHERE key = ? "
+            "AND (expires IS NULL OR expires > ?)",
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        key = self._key(key, version)
+        with self._transaction() as connection:
+            cursor = connection.execute(
+                "DELETE FROM cache WHERE key = ?", (key,))
+        return cursor.rowcount > 0
+
+    def delete_many(self, keys, version=None):
+        rows = [(self._key(key, version),) for key in keys]
+        with self._transaction() as connection:
+            connection.executemany("DELETE FROM cache WHERE key = ?", rows)
+
+    def clear(self):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM cache")
+
+    def _maybe_cull(self):
+        if next(self._writes) % CULL_CHECK_INTERVAL:
+            return
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "DELETE FROM cache WHERE expires IS NOT NULL "
+                "AND expires <= ?", (now,))
+            entries = connection.execute(
+                "SELECT COUNT(*) FROM cache").fetchone()[0]
+            if entries <= self._max_entries:
+                return
+            if self._cull_frequency == 0:
+                connection.execute("DELETE FROM cache")
+                return
+            connection.execute(
+                "DELETE FROM cache WHERE key IN ("
+                "SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                (entries // self._cull_frequency,))
@@ -0,0 +1,86 @@
+import http.client
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+class CacheControlMiddleware:
+    """Заголовки Cache-Control и Vary по имени URL.
+
+    Ответ анониму от представления из settings.CACHE_CONTROL_VIEWS прокси
+    может хранить указанное там число секунд (s-maxage), браузер каждый
+    раз проверяет его по ETag. Ответы вошедшим пользователям и ответы,
+    которые ставят cookie, помечаются private. Заголовки, заданные самим
+    представлением, не меняются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header("Cache-Control"):
+            return response
+        user = getattr(request, "user", None)
+        if user is not None and user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        match = request.resolver_match
+        s_maxage = settings.CACHE_CONTROL_VIEWS.get(
+            match.url_name if match else None)
+        if (s_maxage is None or request.method not in ("GET", "HEAD")
+                or response.status_code not in (200, 304)):
+            return response
+        if response.cookies:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        patch_cache_control(response, public=True, max_age=0,
+                            s_maxage=s_maxage)
+        # Страница зависит от сессии: с cookie сессии прокси не должен
+        # отдавать анонимную копию.
+        patch_vary_headers(response, ("Cookie",))
+        return response
+
+
+def _get_executor():
+    # Один поток: запрос к недоступному прокси ждёт CACHE_PURGE_TIMEOUT,
+    # но не в потоке запроса пользователя.
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1,
+                                       thread_name_prefix="purge")
+    return _executor
+
+
+def _send(paths):
+    url = urlsplit(settings.CACHE_PURGE_URL)
+    for path in paths:
+        try:
+            connection = http.client.HTTPConnection(
+                url.hostname, url.port, timeout=settings.CACHE_PURGE_TIMEOUT)
+            connection.request("PURGE", url.path.rstrip("/") + path)
+            connection.getresponse().read()
+            connection.close()
+        except (OSError, http.client.HTTPException):
+            logger.exception("Не удалось сбросить %s в кеше прокси", path)
+
+
+def _submit(paths):
+    _get_executor().submit(_send, paths)
+
+
+def purge(paths):
+    """После коммита транзакции отправляет из фонового потока PURGE
+    <путь> на settings.CACHE_PURGE_URL для каждой страницы из paths.
+    Прокси должен сбрасывать и варианты пути с ?page=. Ничего не делает,
+    если CACHE_PURGE_URL не задан."""
+    if settings.CACHE_PURGE_URL:
+        paths = list(paths)
+        transaction.on_commit(lambda: _submit(paths))
@@ -0,0 +1,109 @@
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+# Cookie, по которой недавно писавший пользователь читает из основной базы.
+STICKY_COOKIE = "read_primary"
+
+
+def configure_connection(sender, connection, **kwargs):
+    """Применяет settings.SQLITE_PRAGMAS к каждому новому соединению.
+
+    Подключается к сигналу connection_created. journal_mode=WAL
+    сохраняется в файле базы, остальные настройки действуют только на
+    текущее соединение, поэтому выполняются при каждом подключении, а
+    CONN_MAX_AGE не даёт открывать соединения на каждый запрос.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for name, value in getattr(settings, "SQLITE_PRAGMAS", {}).items():
+            cursor.execute(f"PRAGMA {name}={value}")
+
+
+_state = threading.local()
+
+
+@contextmanager
+def use_primary():
+    """Внутри блока все чтения идут в основную базу."""
+    previous = getattr(_state, "read_alias", None)
+    _state.read_alias = None
+    try:
+        yield
+    finally:
+        _state.read_alias = previous
+
+
+def read_from_replica():
+    """Читал ли текущий запрос из реплики. Такая страница может быть
+    старее данных основной базы."""
+    return getattr(_state, "replica_read", False)
+
+
+class ReadReplicaRouter:
+    """Чтения представлений из settings.DATABASE_READ_VIEWS идут в одну из
+    settings.DATABASE_READ_ALIASES, всё остальное — в default.
+
+    Псевдоним чтения выбирает ReadReplicaMiddleware. После первой записи
+    в запросе чтения возвращаются в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, "wrote", False):
+            return None
+        alias = getattr(_state, "read_alias", None)
+        if alias is not None:
+            _state.replica_read = True
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_READ_ALIASES}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+
+class ReadReplicaMiddleware:
+    """Выбирает реплику для GET-запросов к представлениям из
+    settings.DATABASE_READ_VIEWS.
+
+    Пользователь, чей запрос что-то записал, получает cookie и следующие
+    settings.DATABASE_READ_STICKY_SECONDS секунд читает из основной базы,
+    чтобы увидеть свой пост или комментарий, пока реплика отстаёт.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.read_alias = None
+        _state.wrote = False
+        _state.replica_read = False
+        try:
+            response = self.get_response(request)
+            if _state.wrote:
+                response.set_cookie(
+                    STICKY_COOKIE, "1",
+                    max_age=settings.DATABASE_READ_STICKY_SECONDS,
+                    httponly=True)
+        finally:
+            _state.read_alias = None
+            _state.wrote = False
+            _state.replica_read = False
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        aliases = settings.DATABASE_READ_ALIASES
+        if (aliases and request.method in ("GET", "HEAD")
+                and STICKY_COOKIE not in request.COOKIES
+                and request.resolver_match.url_name
+                in settings.DATABASE_READ_VIEWS):
+            _state.read_alias = random.choice(aliases)
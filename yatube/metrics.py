@@ -0,0 +1,216 @@
+import bisect
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import Http404, HttpResponse
+from django.template.backends import django as django_backend
+
+# Имя, тип, описание и границы корзин (None — счётчик) каждой метрики.
+METRICS = {
+    "yatube_request_duration_seconds": (
+        "histogram", "Время обработки запроса.",
+        (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)),
+    "yatube_db_queries": (
+        "histogram", "Число SQL-запросов на запрос.",
+        (0, 1, 2, 5, 10, 20, 50, 100, 200)),
+    "yatube_db_duration_seconds": (
+        "histogram", "Время SQL-запросов на запрос.",
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)),
+    "yatube_template_duration_seconds": (
+        "histogram", "Время рендеринга шаблонов на запрос.",
+        (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)),
+    "yatube_cache_requests_total": (
+        "counter", "Обращения к кешу страниц и фрагментов по исходу.", None),
+}
+
+SUFFIXES = ("_bucket", "_sum", "_count")
+
+_request = threading.local()
+_lock = threading.Lock()
+# Приращения с последней записи в общий файл: строка метрики -> значение.
+_pending = defaultdict(float)
+_last_flush = time.monotonic()
+
+
+def _labels(**labels):
+    return "{" + ",".join(
+        f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def observe(name, value, **labels):
+    bounds = METRICS[name][2]
+    index = bisect.bisect_left(bounds, value)
+    with _lock:
+        # Корзины Prometheus накопительные: значение попадает во все
+        # корзины с границей не меньше него. Остальные тоже упоминаются,
+        # чтобы в выдаче были все корзины.
+        for position, bound in enumerate(bounds):
+            _pending[f"{name}_bucket" + _labels(**labels, le=bound)] += \
+                position >= index
+        _pending[f"{name}_bucket" + _labels(**labels, le="+Inf")] += 1
+        _pending[f"{name}_sum" + _labels(**labels)] += value
+        _pending[f"{name}_count" + _labels(**labels)] += 1
+
+
+def count_cache(outcome):
+    """Учитывает hit/miss/stale кеша в метриках текущего запроса."""
+    cache = getattr(_request, "cache", None)
+    if cache is not None:
+        cache[outcome] += 1
+
+
+def _connect():
+    connection = sqlite3.connect(settings.METRICS_PATH, timeout=30,
+                                 isolation_level=None)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute(
+        "CREATE TABLE IF NOT EXISTS metrics "
+        "(series TEXT PRIMARY KEY, value REAL NOT NULL)")
+    return connection
+
+
+def flush():
+    """Прибавляет накопленные приращения к общему файлу метрик, в который
+    пишут все процессы сайта."""
+    global _last_flush
+    with _lock:
+        pending = list(_pending.items())
+        _pending.clear()
+        _last_flush = time.monotonic()
+    if not pending:
+        return
+    connection = _connect()
+    try:
+        connection.executemany(
+            "INSERT INTO metrics (series, value) VALUES (?, ?) "
+            "ON CONFLICT (series) DO UPDATE SET value = value + excluded.value",
+            pending)
+    finally:
+        connection.close()
+
+
+def render():
+    """Метрики всех процессов в текстовом формате Prometheus."""
+    flush()
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            "SELECT series, value FROM metrics ORDER BY rowid").fetchall()
+    finally:
+        connection.close()
+    families = defaultdict(list)
+    for series, value in rows:
+        name, labels = series.rstrip("}").split("{", 1)
+        labels = labels.split(",")
+        le = float(labels.pop()[4:-1]) if name.endswith("_bucket") else 0
+        suffix = 0
+        for position, ending in enumerate(SUFFIXES, 1):
+            if name.endswith(ending) and name[:-len(ending)] in METRICS:
+                name, suffix = name[:-len(ending)], position
+                break
+        # Серии одних меток вместе, корзины по возрастанию границы.
+        families[name].append(
+            ((labels, suffix, le), f"{series} {value:g}"))
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        if name in families:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+            lines += [line for _, line in sorted(families[name])]
+    return "\n".join(lines) + "\n"
+
+
+def metrics_view(request):
+    """Метрики видят сотрудники и адреса из settings.METRICS_ALLOWED_IPS,
+    остальные получают 404."""
+    if not (request.user.is_staff
+            or request.META.get("REMOTE_ADDR")
+            in settings.METRICS_ALLOWED_IPS):
+        raise Http404
+    return HttpResponse(render(),
+                        content_type="text/plain; version=0.0.4")
+
+
+class MetricsMiddleware:
+    """Время запроса, число и время SQL-запросов, время шаблонов и исходы
+    кеша по имени URL.
+
+    Процесс копит значения в памяти и раз в METRICS_FLUSH_INTERVAL секунд
+    прибавляет их к файлу METRICS_PATH, откуда их читает /metrics.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _request.queries = 0
+        _request.db_time = 0.0
+        _request.template_time = 0.0
+        _request.template_depth = 0
+        _request.cache = defaultdict(int)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(self.time_query))
+                response = self.get_response(request)
+            self.record(request, time.perf_counter() - start)
+        finally:
+            _request.cache = None
+        if time.monotonic() - _last_flush > settings.METRICS_FLUSH_INTERVAL:
+            flush()
+        return response
+
+    @staticmethod
+    def time_query(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            _request.queries += 1
+            _request.db_time += time.perf_counter() - start
+
+    def record(self, request, elapsed):
+        match = request.resolver_match
+        view = (match.url_name or match.view_name) if match else "unresolved"
+        observe("yatube_request_duration_seconds", elapsed, view=view)
+        observe("yatube_db_queries", _request.queries, view=view)
+        observe("yatube_db_duration_seconds", _request.db_time, view=view)
+        observe("yatube_template_duration_seconds", _request.template_time,
+                view=view)
+        with _lock:
+            for outcome, count in _request.cache.items():
+                _pending["yatube_cache_requests_total" + _labels(
+                    view=view, outcome=outcome)] += count
+
+
+class TimedTemplate(django_backend.Template):
+    def render(self, context=None, request=None):
+        if getattr(_request, "cache", None) is None:
+            return super().render(context, request)
+        # Вложенные render_to_string уже входят во время внешнего шаблона.
+        _request.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _request.template_depth -= 1
+            if not _request.template_depth:
+                _request.template_time += time.perf_counter() - start
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """Шаблонизатор Django, который учитывает время рендеринга."""
+
+    def from_string(self, template_code):
+        return TimedTemplate(
+            super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(
+            super().get_template(template_name).template, self)
@@ -0,0 +1,87 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.urls import reverse
+
+from posts.models import RequestProfile, SlowQuery
+
+
+class ProfilingMiddleware:
+    """Профилирование запроса по ?profile=1 или заголовку X-Profile для
+    сотрудников и журнал SQL-запросов дольше SLOW_QUERY_THRESHOLD_MS.
+
+    Результаты сохраняются в RequestProfile и SlowQuery и видны в админке.
+    Если ни то, ни другое не включено, запрос проходит без обёрток.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        profiler = None
+        if (("profile" in request.GET or "HTTP_X_PROFILE" in request.META)
+                and request.user.is_staff):
+            profiler = cProfile.Profile()
+        if threshold is None and profiler is None:
+            return self.get_response(request)
+
+        slow = []
+
+        def log_slow(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                elapsed = (time.perf_counter() - start) * 1000
+                if elapsed >= threshold and not many:
+                    slow.append((context["connection"].alias, sql, params,
+                                 elapsed))
+
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if threshold is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(log_slow))
+            if profiler is not None:
+                profiler.enable()
+                stack.callback(profiler.disable)
+            response = self.get_response(request)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        match = request.resolver_match
+        view_name = match.view_name if match else ""
+        path = request.get_full_path()
+        if profiler is not None:
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats(
+                "cumulative").print_stats(settings.PROFILER_STATS_LINES)
+            profile = RequestProfile.objects.create(
+                path=path, view_name=view_name, user=request.user,
+                duration=elapsed, stats=output.getvalue())
+            response["X-Profile"] = reverse(
+                "admin:posts_requestprofile_change", args=[profile.pk])
+        if slow:
+            SlowQuery.objects.bulk_create([
+                SlowQuery(path=path, view_name=view_name, database=alias,
+                          sql=sql, duration=duration,
+                          plan=self.explain(alias, sql, params))
+                for alias, sql, params, duration in slow
+            ])
+        return response
+
+    def explain(self, alias, sql, params):
+        connection = connections[alias]
+        if connection.vendor != "sqlite":
+            return ""
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                return "\n".join(row[-1] for row in cursor.fetchall())
+        except DatabaseError:
+            return ""
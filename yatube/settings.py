@@ -38,11 +38,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'yatube.metrics.MetricsMiddleware',
+    'yatube.cache_control.CacheControlMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'posts.snapshots.SnapshotMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'yatube.profiling.ProfilingMiddleware',
+    'yatube.db.ReadReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -52,7 +57,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.metrics.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -76,9 +81,21 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Соединение живёт между запросами, а не открывается на каждый.
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Реплики только для чтения (псевдонимы из DATABASES) и представления,
+# которые читают из них. После записи пользователь ещё
+# DATABASE_READ_STICKY_SECONDS секунд читает из основной базы.
+DATABASE_ROUTERS = ['yatube.db.ReadReplicaRouter']
+DATABASE_READ_ALIASES = []
+DATABASE_READ_VIEWS = {
+    'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+}
+DATABASE_READ_STICKY_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -129,8 +146,132 @@ LOGOUT_REDIRECT_URL = "index"
 EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Общий для всех воркеров на хосте кеш в файле SQLite (см. yatube/cache.py)
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'yatube.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
     }
-}
\ No newline at end of file
+}
+
+# Тесты работают с кешем и метриками во временном каталоге.
+TEST_RUNNER = 'yatube.testing.TestRunner'
+
+# Лента подписок: посты раскладываются по лентам подписчиков при публикации,
+# посты авторов с большим числом подписчиков подмешиваются при чтении.
+FEED_FANOUT_MAX_FOLLOWERS = 5000
+FEED_BACKFILL_SIZE = 200
+# Когда у такого автора подписчиков становится не больше этого числа,
+# manage.py restore_fan_out снова раскладывает его посты по лентам.
+FEED_FANOUT_RESTORE_FOLLOWERS = 4500
+
+# Представления (по имени URL), которые по умолчанию листаются курсором
+# ?after=/?before= вместо номера страницы. ?page= работает всегда.
+CURSOR_PAGINATION_VIEWS = set()
+# Представления, которые листаются по номерам без подсчёта всех записей,
+# и сколько номеров страниц показывать по обе стороны от текущей.
+UNCOUNTED_PAGINATION_VIEWS = set()
+PAGINATION_WINDOW = 3
+
+# Страницы ленты кешируются до изменения данных (см. posts.caching).
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Сколько ещё можно отдавать устаревшую копию, пока её пересчитывает
+# другой запрос, сколько живёт блокировка пересчёта и насколько
+# агрессивно обновлять запись до истечения срока.
+FEED_CACHE_STALE_TIMEOUT = 60 * 10
+FEED_CACHE_LOCK_TIMEOUT = 10
+FEED_CACHE_EARLY_REFRESH = 1.0
+
+# Миниатюры постов создаёт отдельный процесс manage.py generate_thumbnails
+# --loop. Больше 0 — создавать их в фоновых потоках процесса сайта.
+THUMBNAIL_WORKERS = 0
+# После стольких неудач (битая или нечитаемая картинка) миниатюру поста
+# больше не пытаются создать.
+THUMBNAIL_MAX_ATTEMPTS = 3
+
+# Загрузки всегда пишутся во временный файл, а не в память.
+FILE_UPLOAD_HANDLERS = [
+    'django.core.files.uploadhandler.TemporaryFileUploadHandler',
+]
+# Ограничения для картинок постов: больше POST_IMAGE_MAX_PIXELS отклоняем,
+# по длинной стороне больше POST_IMAGE_MAX_SIDE уменьшаем.
+POST_IMAGE_MAX_BYTES = 20 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 2560
+
+# Сколько самых новых совпадений поиск ранжирует и показывает.
+SEARCH_MAX_RESULTS = 1000
+
+# Комментарии под постом показываются страницами, следующие подгружаются.
+COMMENTS_PER_PAGE = 20
+
+# Настройки каждого соединения с SQLite (см. yatube/db.py). WAL позволяет
+# читать во время записи, NORMAL не синхронизирует файл на каждой фиксации
+# (в WAL это безопасно для целостности), busy_timeout — сколько мс ждать
+# блокировки записи, cache_size в отрицательных значениях задаётся в КиБ.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+}
+
+# Метрики запросов (см. yatube/metrics.py): процессы раз в
+# METRICS_FLUSH_INTERVAL секунд добавляют свои данные в общий файл,
+# /metrics отдаёт сумму в формате Prometheus.
+METRICS_PATH = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 5
+# Кроме сотрудников, /metrics доступен только с этих адресов (например,
+# сервера Prometheus). За обратным прокси REMOTE_ADDR — адрес прокси,
+# поэтому по умолчанию список пуст.
+METRICS_ALLOWED_IPS = []
+
+# Сотрудник может запустить страницу с ?profile=1 или заголовком X-Profile,
+# результат cProfile (столько строк) сохранится в админке. SQL-запросы
+# дольше SLOW_QUERY_THRESHOLD_MS мс сохраняются с планом; None — выключено.
+PROFILER_STATS_LINES = 60
+SLOW_QUERY_THRESHOLD_MS = None
+
+# Превью поста в лентах: не больше стольких строк и символов.
+POST_PREVIEW_LINES = 8
+POST_PREVIEW_CHARS = 500
+
+# Пользователи по username и группы по slug кешируются в памяти процесса
+# (см. posts/lookups.py): не больше LOOKUP_CACHE_SIZE записей на модель,
+# каждая живёт LOOKUP_CACHE_TTL секунд — столько другой процесс может
+# видеть старое имя после переименования.
+LOOKUP_CACHE_SIZE = 1000
+LOOKUP_CACHE_TTL = 60
+
+# Карточки постов кешируются по отпечатку содержимого (см.
+# posts/fragments.py), поэтому живут долго: после правки поста старая
+# запись не используется и просто истекает.
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Снимки первых SNAPSHOT_PAGES страниц главной, групп и профилей для
+# анонимных посетителей (см. posts/snapshots.py) пишутся в SNAPSHOT_ROOT
+# при каждом изменении поста; None — выключено.
+SNAPSHOT_ROOT = None
+SNAPSHOT_PAGES = 3
+
+# Cache-Control (см. yatube/cache_control.py): ответы анонимам от этих
+# представлений прокси хранит столько секунд (s-maxage), ответы вошедшим
+# пользователям помечаются private. При изменении постов, комментариев,
+# групп, подписок и имён пользователей затронутые страницы сбрасываются
+# запросом PURGE на CACHE_PURGE_URL (например, http://127.0.0.1:6081);
+# None — не отправлять. CACHE_PURGE_TIMEOUT — сколько секунд ждать ответа
+# прокси. При подписке сбрасываются страницы стольких последних постов
+# автора и подписчика.
+CACHE_CONTROL_VIEWS = {
+    'index': 60,
+    'group_posts': 60,
+    'profile': 60,
+    'post_detail': 60,
+}
+CACHE_PURGE_URL = None
+CACHE_PURGE_TIMEOUT = 1
+CACHE_PURGE_AUTHOR_POSTS = 50
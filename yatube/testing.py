@@ -0,0 +1,39 @@
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+@contextmanager
+def isolated_storage():
+    """Кеш, файл метрик и MEDIA_ROOT во временном каталоге: тесты не
+    чистят общий кеш воркеров, не пишут в их метрики и не оставляют
+    загруженные картинки в media/."""
+    with tempfile.TemporaryDirectory() as directory:
+        caches = {
+            alias: dict(config, LOCATION=os.path.join(
+                directory, f"{alias}.cache.sqlite3"))
+            for alias, config in settings.CACHES.items()
+        }
+        with override_settings(
+                CACHES=caches,
+                METRICS_PATH=os.path.join(directory, "metrics.sqlite3"),
+                MEDIA_ROOT=os.path.join(directory, "media")):
+            yield
+
+
+class TestRunner(DiscoverRunner):
+    """manage.py test с isolated_storage(). Для pytest то же делает
+    conftest.py в корне проекта."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._storage = isolated_storage()
+        self._storage.__enter__()
+
+    def teardown_test_environment(self, **kwargs):
+        self._storage.__exit__(None, None, None)
+        super().teardown_test_environment(**kwargs)
@@ -5,6 +5,8 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from yatube.metrics import metrics_view
+
 
 handler404 = "posts.views.page_not_found" #noqa
 handler500 = "posts.views.server_error" #noqa
@@ -14,6 +16,7 @@ urlpatterns = [
     path("auth/", include("django.contrib.auth.urls")),
     path("admin/", admin.site.urls),
     path("about/", include("django.contrib.flatpages.urls")),
+    path("metrics", metrics_view, name="metrics"),
 ]
 
 urlpatterns += [